@@ -0,0 +1,154 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Dict, Optional, AsyncIterator, Callable
+from config import Config
+from metrics import CallRecord, record_call
+from rate_limiter import get_rate_limiter, backoff_delay, parse_retry_after
+from token_counter import count_messages_tokens
+
+if TYPE_CHECKING:
+    import openai
+
+@dataclass
+class ModelResult:
+    """Outcome of one model's answer in a fan-out request"""
+    model: str  # Display name, e.g. "GPT-4"
+    content: Optional[str] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+class AsyncLLMClient:
+    """Send the same conversation to several models concurrently (compare mode)"""
+
+    def __init__(self):
+        self.openai_key = Config.get_openai_key()
+        self.openrouter_key = Config.get_openrouter_key()
+        self.max_retries = 3
+        self.retry_delay = 1  # Initial backoff in seconds
+
+    def _open_client(self, model: str) -> "openai.AsyncOpenAI":
+        """Create an async client for the provider serving the given model"""
+        import openai  # Deferred until compare mode is actually used
+        if model == "GPT-4":
+            if not self.openai_key:
+                raise ValueError("OpenAI client not initialized. Please check your API key.")
+            # Retries go through chat so they are paced by the rate limiter
+            return openai.AsyncOpenAI(api_key=self.openai_key, max_retries=0)
+
+        if not self.openrouter_key:
+            raise ValueError("OpenRouter client not initialized. Please check your API key.")
+        # OpenRouter exposes an OpenAI-compatible API
+        return openai.AsyncOpenAI(
+            api_key=self.openrouter_key,
+            base_url=Config.OPENROUTER_API_BASE,
+            default_headers={"HTTP-Referer": "https://replit.com", "X-Title": "MyChatMe"},
+            max_retries=0
+        )
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], record: Optional[CallRecord] = None) -> str:
+        """Send a chat completion request to a single model.
+
+        Each attempt reserves capacity from the same process-wide limiter as
+        regular chat, so compare mode is paced and honors Retry-After too.
+        """
+        if model not in Config.AVAILABLE_MODELS:
+            raise ValueError(f"Invalid model selection: {model}")
+
+        import openai
+        model_id = Config.AVAILABLE_MODELS[model]
+        limiter = get_rate_limiter("openai" if model == "GPT-4" else "openrouter", model_id)
+        tokens = count_messages_tokens(messages)
+
+        async with self._open_client(model) as client:
+            for attempt in range(self.max_retries):
+                # acquire sleeps, so it runs off the event loop
+                queue_wait = await asyncio.to_thread(limiter.acquire, tokens)
+                if record:
+                    record.queue_wait += queue_wait
+                    record.retries = attempt
+                last_attempt = attempt == self.max_retries - 1
+                try:
+                    response = await client.chat.completions.create(model=model_id, messages=messages)
+                    break
+                except openai.RateLimitError as e:
+                    headers = e.response.headers
+                    delay = parse_retry_after(headers.get("retry-after"))
+                    if delay is None and headers.get("retry-after-ms"):
+                        delay = float(headers["retry-after-ms"]) / 1000
+                    if delay is None:
+                        delay = backoff_delay(self.retry_delay, attempt)
+                    limiter.block_for(delay)
+                    if last_attempt or delay > Config.RATE_LIMIT_MAX_WAIT:
+                        raise Exception(f"{model} API error: Rate limit exceeded ({str(e)})")
+                except (openai.APIConnectionError, openai.InternalServerError):
+                    if last_attempt:
+                        raise
+                    await asyncio.sleep(backoff_delay(self.retry_delay, attempt, cap=Config.RATE_LIMIT_MAX_WAIT))
+
+        if record and response.usage:
+            record.prompt_tokens = response.usage.prompt_tokens
+            record.completion_tokens = response.usage.completion_tokens
+        if not response.choices:
+            raise ValueError(f"No choices in {model} response")
+        return response.choices[0].message.content
+
+    async def _run_one(self, model: str, messages: List[Dict[str, str]],
+                       semaphore: asyncio.Semaphore, timeout: float) -> ModelResult:
+        queued_at = time.perf_counter()
+        async with semaphore:
+            start = time.perf_counter()
+            record = CallRecord(
+                provider="openai" if model == "GPT-4" else "openrouter",
+                model=Config.AVAILABLE_MODELS.get(model, model),
+                kind="compare",
+                queue_wait=start - queued_at
+            )
+            content = None
+            try:
+                content = await asyncio.wait_for(self.chat(model, messages, record), timeout)
+            except asyncio.TimeoutError:
+                record.error = f"Timed out after {timeout:.0f} seconds"
+            except Exception as e:
+                record.error = str(e)
+            record.total_time = time.perf_counter() - start
+            record_call(record)
+            return ModelResult(model=model, content=content, error=record.error, elapsed=record.total_time)
+
+    async def fan_out(
+        self,
+        messages: List[Dict[str, str]],
+        models: List[str],
+        max_concurrency: int = None,
+        timeout: float = None
+    ) -> AsyncIterator[ModelResult]:
+        """Yield each model's result as soon as it finishes; errors are returned, not raised"""
+        semaphore = asyncio.Semaphore(max_concurrency or Config.COMPARE_MAX_CONCURRENCY)
+        timeout = timeout or Config.COMPARE_TIMEOUT
+        tasks = [
+            asyncio.create_task(self._run_one(model, messages, semaphore, timeout))
+            for model in models
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def compare(
+        self,
+        messages: List[Dict[str, str]],
+        models: List[str],
+        on_result: Callable[[ModelResult], None] = None
+    ) -> List[ModelResult]:
+        """Blocking wrapper around fan_out for callers without an event loop (e.g. Streamlit)"""
+        async def collect() -> List[ModelResult]:
+            results = []
+            async for result in self.fan_out(messages, models):
+                if on_result:
+                    on_result(result)
+                results.append(result)
+            return results
+
+        return asyncio.run(collect())
@@ -0,0 +1,110 @@
+"""Benchmark per-request latency of fresh connections vs. the shared keep-alive pool.
+
+Starts a local mock of the OpenRouter chat completions endpoint and sends the same
+request through module-level ``requests.post`` (a new TCP connection per call) and
+through ``OpenRouterClient`` (the pooled session shared by the whole process).
+Loopback connections are nearly free, so ``--handshake-ms`` delays every newly
+accepted connection to stand in for the TCP+TLS handshake to openrouter.ai.
+
+    python benchmark_connection_pool.py --requests 200 --handshake-ms 30
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from config import Config
+from openrouter_client import OpenRouterClient
+
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive between requests
+    # Send headers and body in one segment; otherwise Nagle + delayed ACK add ~40 ms per response
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    latency = 0.0
+    handshake = 0.0
+
+    def setup(self):
+        # Runs once per accepted connection, not once per request
+        if self.handshake:
+            time.sleep(self.handshake)
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": "pong"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_mock_server(latency: float, handshake: float) -> ThreadingHTTPServer:
+    MockOpenRouterHandler.latency = latency
+    MockOpenRouterHandler.handshake = handshake
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockOpenRouterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(label: str, call, count: int) -> list:
+    call()  # Warm up (and, for the pool, open the first connection)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<28} mean={statistics.mean(timings):7.3f} ms  "
+        f"p50={statistics.median(timings):7.3f} ms  "
+        f"p95={statistics.quantiles(timings, n=20)[18]:7.3f} ms"
+    )
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated server processing time")
+    parser.add_argument("--handshake-ms", type=float, default=30.0, help="simulated cost of opening a connection")
+    args = parser.parse_args()
+
+    server = start_mock_server(args.latency_ms / 1000, args.handshake_ms / 1000)
+    Config.OPENROUTER_API_BASE = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+    client = OpenRouterClient()
+    messages = [{"role": "user", "content": "ping"}]
+    payload = client._build_payload(messages)
+    url = f"{Config.OPENROUTER_API_BASE}/chat/completions"
+
+    print(f"{args.requests} requests per mode against {url}")
+    fresh = measure(
+        "fresh connection per call",
+        lambda: requests.post(url, headers=client.headers, json=payload, timeout=30).json(),
+        args.requests
+    )
+    pooled = measure("pooled OpenRouterClient", lambda: client.create(messages), args.requests)
+    saved = statistics.mean(fresh) - statistics.mean(pooled)
+    print(f"saved per request: {saved:.3f} ms ({saved / statistics.mean(fresh):.1%})")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark PDF export throughput and peak memory on a synthetic long session.
+
+Builds a session of ``--messages`` messages, mixing short Japanese and English
+turns with the occasional pasted code block, and renders it with
+``pdf_render.render_pdf`` in a fresh child process so the reported peak RSS
+belongs to the export alone.
+
+    python benchmark_pdf_export.py --messages 10000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+from pdf_export import PdfDocument
+from pdf_render import get_pdf_styles, render_pdf
+
+
+def make_document(filename: str, messages: int, seed: int) -> PdfDocument:
+    rng = random.Random(seed)
+    code_line = "    result = [transform(item) for item in items if item is not None]  # <filter> & map"
+    samples = [
+        "東京の明日の天気を教えてください。",
+        "明日の東京は晴れのち曇り、最高気温は二十三度の予報です。" * 4,
+        "Could you summarize the trade-offs between the two approaches we discussed?",
+        "Sure. The first keeps everything in memory, which is simple but grows with the session. " * 6,
+    ]
+    turns = []
+    for i in range(messages):
+        if rng.random() < 0.05:
+            content = "```python\n" + "\n".join(code_line for _ in range(rng.randint(50, 400))) + "\n```"
+        else:
+            content = rng.choice(samples)
+        turns.append(("User" if i % 2 == 0 else "Assistant", "2026-01-01 12:00:00 JST", content))
+    return PdfDocument(
+        filename=filename,
+        title="Chat Session - benchmark",
+        model="GPT-4",
+        system_prompt="You are a helpful assistant.",
+        messages=turns
+    )
+
+
+def _render(document: PdfDocument, results) -> None:
+    get_pdf_styles()  # Font registration is a one-time cost per worker, not per export
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    render_pdf(document)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(document.filename, "rb") as f:
+        pages = f.read().count(b"/Type /Page\n")
+    results.put((elapsed, pages, baseline, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000, help="messages in the synthetic session")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        document = make_document(os.path.join(tmp, "benchmark.pdf"), args.messages, args.seed)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        worker = context.Process(target=_render, args=(document, results))
+        worker.start()
+        elapsed, pages, baseline, peak = results.get()
+        worker.join()
+        size = os.path.getsize(document.filename)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    print(f"{args.messages} messages -> {pages} pages, {size / 1e6:.1f} MB in {elapsed:.1f} s")
+    print(f"throughput: {pages / elapsed:.1f} pages/s")
+    print(f"peak RSS: {peak / 1024:.1f} MB (worker baseline {baseline / 1024:.1f} MB, "
+          f"export added {(peak - baseline) / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Benchmark cold-start cost: import time of the app's modules and time to first render.
+
+Every measurement runs in a fresh interpreter from an empty scratch directory
+(only ``locales`` is linked in), so no chat history or caches carry over:
+
+- ``python -X importtime`` over the modules ``main.py`` imports, reported per
+  top-level import with the heaviest packages underneath.
+- the first run of ``main.py`` under ``streamlit.testing.v1.AppTest``, timed
+  from interpreter start until the page has rendered.
+
+Dummy API keys are set so the clients are configured as in production; nothing
+is sent at startup. Dependencies that must only load on first use (``openai``
+for OpenAI calls, ``reportlab`` for PDF export) are checked in both runs.
+
+The exit status is 1 when a deferred dependency is loaded at startup, or when
+``--baseline`` is given and a median is more than ``--tolerance`` slower than
+the saved one. Save a baseline on the machine the check runs on:
+
+    python benchmark_startup.py --runs 5 --save startup_baseline.json
+    python benchmark_startup.py --runs 5 --baseline startup_baseline.json
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(ROOT, "main.py")
+DEFERRED = ("openai", "reportlab")
+
+RENDER_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+rendered_at = time.time()
+if at.exception:
+    sys.exit(f"first render failed: {at.exception[0].message}")
+print(json.dumps({"rendered_at": rendered_at, "loaded": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def app_imports() -> List[str]:
+    """Top-level modules imported by main.py, in order"""
+    with open(MAIN, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+
+def child_env(scratch: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env.setdefault("OPENROUTER_API_KEY", "sk-or-benchmark")
+    return env
+
+
+def measure_imports(scratch: str) -> Tuple[float, List[Tuple[str, int]], List[Tuple[str, int]]]:
+    """Total import time in ms, per top-level import and per package (cumulative microseconds)"""
+    modules = app_imports()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=scratch, env=child_env(scratch), capture_output=True, text=True, check=True
+    )
+    top_level = []
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # The header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        # Interpreter startup (site, encodings) also shows up at depth 0
+        if depth == 0 and name in modules:
+            top_level.append((name, int(cumulative)))
+        # Submodules are listed before their package, whose time includes theirs
+        root = name.split(".")[0]
+        packages[root] = max(packages.get(root, 0), int(cumulative))
+    total_ms = sum(cumulative for _, cumulative in top_level) / 1000
+    return total_ms, top_level, sorted(packages.items(), key=lambda item: -item[1])
+
+
+def measure_first_render(scratch: str) -> Tuple[float, List[str]]:
+    """Milliseconds from interpreter start to the first rendered page, and deferred modules loaded"""
+    started_at = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", RENDER_SCRIPT, MAIN, *DEFERRED],
+        cwd=scratch, env=child_env(scratch), capture_output=True, text=True
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return (report["rendered_at"] - started_at) * 1000, report["loaded"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to take the median of")
+    parser.add_argument("--top", type=int, default=10, help="packages to list in the breakdown")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument("--save", help="write this run's medians to a JSON file")
+    args = parser.parse_args()
+
+    import_runs, render_runs = [], []
+    loaded = set()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.symlink(os.path.join(ROOT, "locales"), os.path.join(scratch, "locales"))
+        for _ in range(args.runs):
+            total_ms, top_level, packages = measure_imports(scratch)
+            import_runs.append(total_ms)
+            loaded.update(name for name, _ in packages if name in DEFERRED)
+            render_ms, render_loaded = measure_first_render(scratch)
+            render_runs.append(render_ms)
+            loaded.update(render_loaded)
+
+    result = {
+        "import_ms": round(statistics.median(import_runs), 1),
+        "first_render_ms": round(statistics.median(render_runs), 1),
+    }
+
+    # The breakdown is from the last run; single runs are too noisy to compare
+    print("cumulative import time of main.py's imports (last run):")
+    for name, cumulative in sorted(top_level, key=lambda item: -item[1]):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print("heaviest packages (any depth):")
+    for name, cumulative in packages[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print(f"imports: {result['import_ms']:.1f} ms, time to first render: {result['first_render_ms']:.1f} ms "
+          f"(median of {args.runs})")
+
+    failures = []
+    if loaded:
+        failures.append(f"loaded at startup but meant to load on first use: {', '.join(sorted(loaded))}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key, value in result.items():
+            limit = baseline[key] * (1 + args.tolerance)
+            print(f"{key}: {value:.1f} ms vs baseline {baseline[key]:.1f} ms (limit {limit:.1f} ms)")
+            if value > limit:
+                failures.append(f"{key} regressed: {value:.1f} ms > {limit:.1f} ms")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,98 +1,194 @@
-from typing import List, Dict, Optional
+from typing import Deque, Iterable, Iterator, List, Dict, Optional, TextIO, Tuple, Union
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from datetime import datetime
 import json
 from config import Config
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+import io
 import os
-import pytz
+import tarfile
+import tempfile
+import time
+import uuid
+import zipfile
+from itertools import islice
+from token_counter import count_tokens, message_tokens
+from chat_store import ChatStore, create_chat_store
+from chat_message import ChatMessage
+from datetime_format import format_timestamp, format_timestamps
+from chat_search import ChatSearchIndex, SearchHit, get_shared_index, make_snippet
+from pdf_export import PdfDocument
+from semantic_memory import SemanticMemory
+from message_log import MessageLog
 
 @dataclass
 class ChatSession:
     id: str
-    messages: List[Dict[str, str]]
+    messages: MessageLog  # Lists are converted; older messages spill to disk past the memory cap
     system_prompt: str
     model: str
     created_at: str
     context_summary: Optional[str] = None
-    context_messages: List[Dict[str, str]] = None
+    context_messages: Deque[ChatMessage] = None  # The most recent CONTEXT_WINDOW_MESSAGES messages
+    context_tokens: int = 0  # Running token total of context_messages
+    summary_watermark: int = 0  # Number of messages already folded into context_summary
+    messages_loaded: bool = True  # False for history headers whose messages are still in the store
+    memory: Optional[SemanticMemory] = None  # Messages that have left the context window; None while not loaded
 
     def __post_init__(self):
+        if not isinstance(self.messages, MessageLog):
+            self.messages = MessageLog(self.messages)
         if self.context_messages is None:
-            self.context_messages = []
+            self.context_messages = deque(maxlen=Config.CONTEXT_WINDOW_MESSAGES)
+        if self.memory is None and self.messages_loaded and Config.SEMANTIC_MEMORY_ENABLED:
+            self.memory = SemanticMemory()
 
 class ChatManager:
-    def __init__(self):
+    def __init__(self, owner: Optional[str], store: Optional[ChatStore] = None):
+        """owner identifies whose history this is; None keeps it in memory for this session only"""
+        self.owner = owner
+        self.store = store or create_chat_store(owner)
         self.current_session: ChatSession = self._create_new_session()
-        self.history: List[ChatSession] = []
-        self._setup_pdf_fonts()
-
-    def _setup_pdf_fonts(self):
-        """Set up CID fonts for PDF generation with Japanese support"""
-        try:
-            # Register the Japanese font
-            pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
-            pdfmetrics.registerFont(UnicodeCIDFont('HeiseiKakuGo-W5'))
-        except Exception as e:
-            print(f"Warning: Could not register PDF fonts: {str(e)}")
+        # Only headers are read up front; messages are loaded when a chat is opened
+        self.history: List[ChatSession] = [
+            ChatSession(messages=[], messages_loaded=False, **header)
+            for header in self.store.list_sessions()
+        ]
+        # id -> session and id -> selector label, kept in step with self.history
+        self._sessions_by_id: Dict[str, ChatSession] = {session.id: session for session in self.history}
+        self._history_ids: List[str] = [session.id for session in self.history]
+        self._history_labels: Dict[str, str] = {
+            session.id: self._history_label(session) for session in self.history
+        }
+        # History sessions with messages in memory, least recently opened first
+        self._loaded_ids: "OrderedDict[str, None]" = OrderedDict()
+        # Index for a store that is private to this manager; shared stores use get_shared_index
+        self._private_index: Optional[ChatSearchIndex] = None
 
-    def _format_datetime(self, dt_str: str, timezone: str = None) -> str:
-        """Format datetime string according to the specified timezone"""
-        if not timezone:
-            timezone = Config.DEFAULT_TIMEZONE
-
-        try:
-            dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
-            tz = pytz.timezone(timezone)
-            local_dt = pytz.utc.localize(dt).astimezone(tz)
-            return local_dt.strftime("%Y-%m-%d %H:%M:%S %Z")
-        except Exception as e:
-            print(f"Error formatting datetime: {str(e)}")
-            return dt_str
+    def _format_datetime(self, dt_value: Union[int, str], timezone: str = None) -> str:
+        """Format an epoch timestamp or UTC datetime string according to the specified timezone"""
+        return format_timestamp(dt_value, timezone)
 
     def _create_new_session(self, system_prompt: str = "", model: str = "gpt-4o") -> ChatSession:
         return ChatSession(
-            id=datetime.now().strftime("%Y%m%d_%H%M%S"),
+            # The suffix keeps ids unique in the store when sessions start within the same second
+            id=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}",
             messages=[],
             system_prompt=system_prompt,
             model=model,
             created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            context_summary=None,
-            context_messages=[]
+            context_summary=None
         )
 
+    @staticmethod
+    def _history_label(session: ChatSession) -> str:
+        return f"Chat {session.created_at}"
+
+    def history_ids(self) -> List[str]:
+        """Ids of history sessions, oldest first. The list is shared; do not modify it."""
+        return self._history_ids
+
+    def history_label(self, session_id: str) -> str:
+        """Selector label of a history session; unknown ids are returned unchanged."""
+        return self._history_labels.get(session_id, session_id)
+
+    def in_history(self, session: ChatSession) -> bool:
+        return session.id in self._sessions_by_id
+
+    def _archive_current(self) -> None:
+        """Move the current session into the history list if it has any messages."""
+        session = self.current_session
+        if session.messages and not self.in_history(session):
+            self.history.append(session)
+            self._sessions_by_id[session.id] = session
+            self._history_ids.append(session.id)
+            self._history_labels[session.id] = self._history_label(session)
+            self._track_loaded(session)
+
+    def _track_loaded(self, session: ChatSession) -> None:
+        """Keep message bodies of at most MAX_HISTORY_CHATS history sessions in memory."""
+        self._loaded_ids[session.id] = None
+        self._loaded_ids.move_to_end(session.id)
+
+        while len(self._loaded_ids) > Config.MAX_HISTORY_CHATS:
+            evicted_id, _ = self._loaded_ids.popitem(last=False)
+            evicted = self._sessions_by_id.get(evicted_id)
+            if evicted is not None and evicted is not self.current_session:
+                evicted.messages.close()
+                evicted.context_messages.clear()
+                evicted.memory = None  # Rebuilt from the messages if the session is opened again
+                evicted.context_tokens = 0
+                evicted.messages_loaded = False
+
+    def _ensure_loaded(self, session: ChatSession) -> None:
+        """Read a history session's messages from the store on first use."""
+        if session.messages_loaded:
+            return
+        session.messages.close()
+        session.messages = MessageLog(self.store.iter_session_messages(session.id))
+        session.context_messages.clear()
+        session.context_messages.extend(session.messages[-Config.CONTEXT_WINDOW_MESSAGES:])
+        session.context_tokens = sum(message_tokens(msg) for msg in session.context_messages)
+        if Config.SEMANTIC_MEMORY_ENABLED:
+            session.memory = SemanticMemory()
+        session.messages_loaded = True
+
     def new_chat(self, system_prompt: str, model: str) -> None:
-        if self.current_session.messages:
-            self.history.append(self.current_session)
-            if len(self.history) > Config.MAX_HISTORY_CHATS:
-                self.history.pop(0)
+        self._archive_current()
         self.current_session = self._create_new_session(system_prompt, model)
 
     def add_message(self, role: str, content: str) -> None:
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self.current_session.messages.append(message)
-        self.current_session.context_messages.append(message)
-
-        # Keep only the most recent context window messages
-        if len(self.current_session.context_messages) > Config.CONTEXT_WINDOW_MESSAGES:
-            self.current_session.context_messages.pop(0)
-
-    def get_messages(self, include_system: bool = True, timezone: str = None) -> List[Dict[str, str]]:
+        message = ChatMessage(role, content)
+        session = self.current_session
+        if not session.messages:
+            # Sessions are only persisted once they have content
+            self.store.save_session(session)
+        session.messages.append(message)
+
+        # The bounded deque drops its oldest message on append; take it out of the running total first
+        context = session.context_messages
+        if len(context) == context.maxlen:
+            session.context_tokens -= message_tokens(context[0])
+        context.append(message)
+        # Counted once here; later turns reuse the cached count
+        session.context_tokens += message_tokens(message)
+        self.store.append_message(session.id, message)
+        index = self._search_index(create=False)
+        if index is not None:
+            index.add(session.id, len(session.messages) - 1, content)
+
+    def set_model(self, model: str) -> None:
+        """Record the model that answered the latest turn."""
+        self.current_session.model = model
+        if self.current_session.messages:
+            self.store.save_session(self.current_session)
+
+    def _select_context(self, budget: int) -> List[ChatMessage]:
+        """Newest-first selection of context messages that fit within the token budget"""
+        context = self.current_session.context_messages
+        if self.current_session.context_tokens <= budget:
+            return list(context)
+
+        selected = []
+        for msg in reversed(context):
+            budget -= message_tokens(msg)
+            # Always keep the latest message, even if it alone exceeds the budget
+            if budget < 0 and selected:
+                break
+            selected.append(msg)
+        selected.reverse()
+        return selected
+
+    def get_messages(self, include_system: bool = True, model: str = None) -> List[Dict[str, str]]:
+        """Provider-format messages for the next request, trimmed to the model's token budget"""
         messages = []
+        budget = Config.MODEL_CONTEXT_BUDGETS.get(model, Config.MAX_CONTEXT_LENGTH)
         if include_system and self.current_session.system_prompt:
             messages.append({
                 "role": "system",
                 "content": self.current_session.system_prompt
             })
+            budget -= count_tokens(self.current_session.system_prompt)
 
         # Add context summary if available
         if self.current_session.context_summary:
@@ -100,61 +196,175 @@ class ChatManager:
                 "role": "system",
                 "content": f"Previous conversation context: {self.current_session.context_summary}"
             })
+            budget -= count_tokens(self.current_session.context_summary)
+
+        # Add older messages related to the latest one, if any fit next to the context window
+        recalled = self._recall_memory(min(Config.MEMORY_MAX_TOKENS, budget - self.current_session.context_tokens))
+        if recalled:
+            messages.append({
+                "role": "system",
+                "content": f"Relevant earlier messages:\n{recalled}"
+            })
+            budget -= count_tokens(recalled)
 
-        # Add recent context messages with formatted timestamps
-        for msg in self.current_session.context_messages:
-            formatted_msg = msg.copy()
-            if "timestamp" in formatted_msg:
-                formatted_msg["timestamp"] = self._format_datetime(formatted_msg["timestamp"], timezone)
-            messages.append(formatted_msg)
+        # Add recent context messages; converted to dicts only here, when a request is built
+        messages.extend(msg.to_provider_dict() for msg in self._select_context(budget))
 
         return messages
 
-    def update_context_summary(self, summary: str) -> None:
-        """Update the conversation context summary."""
-        self.current_session.context_summary = summary
+    @staticmethod
+    def _update_memory(session: ChatSession) -> None:
+        """Embed the messages that have left the context window since the last update.
+
+        Done on demand rather than in add_message or when a history session is
+        loaded, so neither pays for embedding a long session up front.
+        """
+        older = len(session.messages) - len(session.context_messages)
+        for position, message in enumerate(session.messages[len(session.memory):older], len(session.memory)):
+            session.memory.add(position, message.content)
+
+    def _recall_memory(self, budget: int) -> str:
+        """Older messages most similar to the latest one, as long as they fit in the budget"""
+        session = self.current_session
+        if session.memory is None or not session.context_messages or budget <= 0:
+            return ""
+        self._update_memory(session)
+        if not session.memory:
+            return ""
+
+        lines = []
+        for position, _ in session.memory.search(session.context_messages[-1].content):
+            message = session.messages[position]
+            budget -= message_tokens(message)
+            if budget < 0:
+                break
+            lines.append(f"{message.role}: {message.content}")
+        return "\n".join(lines)
+
+    def update_context_summary(self, summary: str, session: Optional[ChatSession] = None,
+                               watermark: Optional[int] = None) -> None:
+        """Update the conversation context summary.
+
+        Background summary jobs pass the session they summarized, which may no
+        longer be the current one by the time they finish, and the number of
+        messages the summary covers.
+        """
+        session = session or self.current_session
+        session.context_summary = summary
+        if watermark is not None:
+            session.summary_watermark = watermark
+        self.store.save_session(session)
 
     def load_chat(self, session_id: str) -> bool:
-        for session in self.history:
-            if session.id == session_id:
-                self.current_session = session
-                return True
-        return False
+        session = self._sessions_by_id.get(session_id)
+        if session is None:
+            return False
+        if session is not self.current_session:
+            self._archive_current()
+            self._ensure_loaded(session)
+            self._track_loaded(session)
+            self.current_session = session
+        return True
 
     def clear_current_chat(self) -> None:
+        # A chat that never made it into the history is discarded, as before
+        if self.current_session.messages and not self.in_history(self.current_session):
+            self.store.delete_session(self.current_session.id)
+            index = self._search_index(create=False)
+            if index is not None:
+                index.remove_session(self.current_session.id)
+            self.current_session.messages.close()
         self.current_session = self._create_new_session(
             self.current_session.system_prompt,
             self.current_session.model
         )
 
-    def export_chat_markdown(self, timezone: str = None) -> str:
-        """Export current chat session as Markdown format."""
-        md_content = []
+    def _search_index(self, create: bool = True) -> Optional[ChatSearchIndex]:
+        """The owner's search index: one per process for a shared store, else one per manager.
+
+        Built from the store on the first search, then kept up to date by add_message.
+        """
+        if self.store.index_key is not None:
+            return get_shared_index(self.store.index_key, create)
+        if self._private_index is None and create:
+            self._private_index = ChatSearchIndex()
+        return self._private_index
+
+    def search(self, query: str, limit: int = 20) -> List[SearchHit]:
+        """Full-text search over the messages of every stored chat of this owner, best match first"""
+        index = self._search_index()
+        index.ensure_built(self.store.iter_messages)
+
+        hits = []
+        # The index only holds this owner's messages; hits are further limited to sessions this manager knows
+        for hit in index.search(query, limit):
+            session = self._sessions_by_id.get(hit.session_id)
+            if session is None and hit.session_id == self.current_session.id:
+                session = self.current_session
+            if session is None:
+                continue
+            if session.messages_loaded:
+                message = session.messages[hit.position]
+            else:
+                message = self.store.load_message(hit.session_id, hit.position)
+            if message is not None:
+                hit.snippet = make_snippet(message.content, query)
+                hits.append(hit)
+        return hits
+
+    def _iter_session_messages(self, session: ChatSession) -> Iterator[ChatMessage]:
+        """A session's messages in order; sessions not in memory are read from the store in batches"""
+        return iter(session.messages) if session.messages_loaded else self.store.iter_session_messages(session.id)
+
+    @staticmethod
+    def _iter_with_timestamps(messages: Iterable[ChatMessage], timezone: str = None,
+                              batch_size: int = None) -> Iterator[Tuple[ChatMessage, str]]:
+        """Pair messages with their formatted timestamps, formatting a batch at a time"""
+        batch_size = batch_size or Config.EXPORT_BATCH_MESSAGES
+        messages = iter(messages)
+        while True:
+            batch = list(islice(messages, batch_size))
+            if not batch:
+                return
+            yield from zip(batch, format_timestamps((msg.created_at for msg in batch), timezone))
+
+    def iter_chat_markdown(self, session: Optional[ChatSession] = None, timezone: str = None) -> Iterator[str]:
+        """Yield a session's Markdown export piece by piece, the current session by default.
+
+        Sessions whose messages are not in memory are read from the store in batches.
+        """
+        session = session or self.current_session
 
         # Add header with timezone-aware timestamp
-        created_at = self._format_datetime(self.current_session.created_at, timezone)
-        md_content.append(f"# Chat Session - {created_at}\n")
-        md_content.append(f"Model: {self.current_session.model}\n")
+        created_at = self._format_datetime(session.created_at, timezone)
+        yield f"# Chat Session - {created_at}\n\n"
+        yield f"Model: {session.model}\n\n"
 
         # Add system prompt if exists
-        if self.current_session.system_prompt:
-            md_content.append("## System Prompt\n")
-            md_content.append(f"{self.current_session.system_prompt}\n")
+        if session.system_prompt:
+            yield "## System Prompt\n\n"
+            yield f"{session.system_prompt}\n\n"
 
         # Add context summary if exists
-        if self.current_session.context_summary:
-            md_content.append("## Context Summary\n")
-            md_content.append(f"{self.current_session.context_summary}\n")
+        if session.context_summary:
+            yield "## Context Summary\n\n"
+            yield f"{session.context_summary}\n\n"
 
         # Add messages with timezone-aware timestamps
-        md_content.append("## Messages\n")
-        for msg in self.current_session.messages:
-            role = msg["role"].title()
-            content = msg["content"].replace("\n", "\n  ")
-            timestamp = self._format_datetime(msg.get("timestamp", ""), timezone)
-            md_content.append(f"### {role} ({timestamp})\n{content}\n")
+        yield "## Messages\n\n"
+        for msg, timestamp in self._iter_with_timestamps(self._iter_session_messages(session), timezone):
+            role = msg.role.title()
+            content = msg.content.replace("\n", "\n  ")
+            yield f"### {role} ({timestamp})\n{content}\n\n"
+
+    def write_chat_markdown(self, file: TextIO, session: Optional[ChatSession] = None, timezone: str = None) -> None:
+        """Stream a session's Markdown export to an open text file"""
+        for chunk in self.iter_chat_markdown(session, timezone):
+            file.write(chunk)
 
-        return "\n".join(md_content)
+    def export_chat_markdown(self, timezone: str = None) -> str:
+        """Export current chat session as Markdown format."""
+        return "".join(self.iter_chat_markdown(timezone=timezone))
 
     def save_markdown_file(self, timezone: str = None) -> str:
         """Save current chat session as Markdown file and return the filename."""
@@ -163,72 +373,90 @@ class ChatManager:
             os.makedirs("export", exist_ok=True)
 
             filename = f"export/chat_export_{self.current_session.id}.md"
-            content = self.export_chat_markdown(timezone)
             with open(filename, "w", encoding="utf-8") as f:
-                f.write(content)
+                self.write_chat_markdown(f, timezone=timezone)
             return filename
         except Exception as e:
             raise Exception(f"Failed to save markdown file: {str(e)}")
 
-    def export_chat_pdf(self, timezone: str = None) -> str:
-        """Export current chat session as PDF format."""
+    def export_history_archive(self, timezone: str = None, archive_format: str = None) -> str:
+        """Export every stored chat session as Markdown files in one zip or tar.gz archive.
+
+        Sessions are written one at a time straight from the store, so memory
+        use does not grow with the size of the history.
+        """
+        archive_format = archive_format or Config.EXPORT_ARCHIVE_FORMAT
+        if archive_format not in ("zip", "tar.gz"):
+            raise ValueError(f"Unsupported archive format: {archive_format}")
         try:
-            # Create export directory if it doesn't exist
             os.makedirs("export", exist_ok=True)
 
-            filename = f"export/chat_export_{self.current_session.id}.pdf"
-            doc = SimpleDocTemplate(filename, pagesize=A4)
-            styles = getSampleStyleSheet()
-
-            # Create custom styles with Japanese font support
-            styles.add(ParagraphStyle(
-                name='JapaneseText',
-                parent=styles['Normal'],
-                fontName='HeiseiMin-W3',
-                fontSize=10,
-                leading=14
-            ))
-            styles.add(ParagraphStyle(
-                name='JapaneseHeading',
-                parent=styles['Heading1'],
-                fontName='HeiseiKakuGo-W5',
-                fontSize=16,
-                leading=20
-            ))
-
-            story = []
-
-            # Add header with timezone-aware timestamp
-            created_at = self._format_datetime(self.current_session.created_at, timezone)
-            story.append(Paragraph(f"Chat Session - {created_at}", styles['JapaneseHeading']))
-            story.append(Paragraph(f"Model: {self.current_session.model}", styles['JapaneseText']))
-            story.append(Spacer(1, 12))
-
-            # Add system prompt if exists
-            if self.current_session.system_prompt:
-                story.append(Paragraph("System Prompt", styles['JapaneseHeading']))
-                story.append(Paragraph(self.current_session.system_prompt, styles['JapaneseText']))
-                story.append(Spacer(1, 12))
-
-            # Add context summary if exists
-            if self.current_session.context_summary:
-                story.append(Paragraph("Context Summary", styles['JapaneseHeading']))
-                story.append(Paragraph(self.current_session.context_summary, styles['JapaneseText']))
-                story.append(Spacer(1, 12))
-
-            # Add messages with timezone-aware timestamps
-            story.append(Paragraph("Messages", styles['JapaneseHeading']))
-            for msg in self.current_session.messages:
-                role = msg["role"].title()
-                content = msg["content"]
-                timestamp = self._format_datetime(msg.get("timestamp", ""), timezone)
-
-                story.append(Paragraph(f"{role} ({timestamp})", styles['JapaneseHeading']))
-                story.append(Paragraph(content, styles['JapaneseText']))
-                story.append(Spacer(1, 12))
-
-            doc.build(story)
+            filename = f"export/chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{archive_format}"
+            sessions = (
+                ChatSession(messages=[], messages_loaded=False, **header)
+                for header in self.store.list_sessions()
+            )
+            if archive_format == "zip":
+                with zipfile.ZipFile(filename, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                    for session in sessions:
+                        entry = archive.open(f"chat_export_{session.id}.md", "w", force_zip64=True)
+                        with io.TextIOWrapper(entry, encoding="utf-8") as f:
+                            self.write_chat_markdown(f, session, timezone)
+            else:
+                with tarfile.open(filename, "w:gz") as archive:
+                    for session in sessions:
+                        # Tar headers need the size up front, so each entry is staged in a temporary file
+                        with tempfile.TemporaryFile() as staged:
+                            f = io.TextIOWrapper(staged, encoding="utf-8")
+                            self.write_chat_markdown(f, session, timezone)
+                            f.flush()
+                            f.detach()
+                            info = tarfile.TarInfo(f"chat_export_{session.id}.md")
+                            info.size = staged.tell()
+                            info.mtime = time.time()
+                            staged.seek(0)
+                            archive.addfile(info, staged)
             return filename
+        except Exception as e:
+            raise Exception(f"Failed to export chat history: {str(e)}")
+
+    def pdf_document(self, timezone: str = None) -> PdfDocument:
+        """Snapshot the current session for PDF rendering, e.g. in a background worker.
+
+        Messages are written to a spool file a batch at a time, so spilled
+        messages are read back on demand instead of all at once. The caller
+        removes the spool with discard_messages_file (PdfExportQueue does).
+        """
+        session = self.current_session
+        os.makedirs(Config.SPILL_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=os.path.abspath(Config.SPILL_DIR), prefix="pdf_", suffix=".jsonl", delete=False
+        ) as spool:
+            try:
+                for msg, timestamp in self._iter_with_timestamps(self._iter_session_messages(session), timezone):
+                    spool.write(json.dumps([msg.role.title(), timestamp, msg.content], ensure_ascii=False) + "\n")
+            except BaseException:
+                spool.close()
+                os.remove(spool.name)
+                raise
+        return PdfDocument(
+            filename=f"export/chat_export_{session.id}.pdf",
+            # Add header with timezone-aware timestamp
+            title=f"Chat Session - {self._format_datetime(session.created_at, timezone)}",
+            model=session.model,
+            system_prompt=session.system_prompt,
+            context_summary=session.context_summary,
+            messages_file=spool.name
+        )
 
+    def export_chat_pdf(self, timezone: str = None) -> str:
+        """Export current chat session as PDF format in this process."""
+        from pdf_render import render_pdf  # reportlab is loaded on the first export
+        try:
+            document = self.pdf_document(timezone)
+            try:
+                return render_pdf(document)
+            finally:
+                document.discard_messages_file()
         except Exception as e:
-            raise Exception(f"Failed to save PDF file: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to save PDF file: {str(e)}")
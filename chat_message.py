@@ -0,0 +1,41 @@
+import calendar
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+# Every message shares one string object per role instead of carrying its own copy
+_ROLES = {role: sys.intern(role) for role in ("system", "user", "assistant")}
+
+def parse_timestamp(value: Union[int, float, str, None]) -> int:
+    """Epoch seconds from an epoch number or a legacy "%Y-%m-%d %H:%M:%S" string in UTC"""
+    if value is None or value == "":
+        return int(time.time())
+    if isinstance(value, (int, float)) or value.isdigit():
+        return int(value)
+    return calendar.timegm(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timetuple())
+
+class ChatMessage:
+    """A chat message with an epoch timestamp, kept small for long sessions"""
+
+    __slots__ = ("role", "content", "created_at", "tokens")
+
+    def __init__(self, role: str, content: str, created_at: Optional[int] = None, tokens: Optional[int] = None):
+        self.role = _ROLES.get(role) or sys.intern(role)
+        self.content = content
+        self.created_at = int(time.time()) if created_at is None else created_at  # Epoch seconds, UTC
+        self.tokens = tokens  # Cached token estimate, see token_counter.message_tokens
+
+    def to_provider_dict(self) -> Dict[str, str]:
+        """The {"role", "content"} form sent to the chat completion APIs"""
+        return {"role": self.role, "content": self.content}
+
+    def __getstate__(self):
+        return (self.role, self.content, self.created_at, self.tokens)
+
+    def __setstate__(self, state):
+        role, self.content, self.created_at, self.tokens = state
+        self.role = _ROLES.get(role) or sys.intern(role)
+
+    def __repr__(self) -> str:
+        return f"ChatMessage(role={self.role!r}, content={self.content[:40]!r}, created_at={self.created_at})"
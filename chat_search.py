@@ -0,0 +1,153 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from config import Config
+
+# Scripts written without spaces (kana, CJK ideographs, Hangul); indexed as character bigrams
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_PATTERN = re.compile(rf"(?P<cjk>[{_CJK}]+)|(?P<word>[^\W_{_CJK}]+)")
+
+def normalize(text: str) -> str:
+    """Fold full-width forms and case so "ＡＢＣ" matches "abc" and "ｶﾅ" matches "カナ" """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+def tokenize(text: str) -> List[str]:
+    """Words for Latin text, character bigrams for CJK runs (single characters stay as is)"""
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(normalize(text)):
+        run = match.group()
+        if match.lastgroup == "word" or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+@dataclass
+class SearchHit:
+    session_id: str
+    position: int  # Index of the message within the session
+    score: float
+    snippet: str = ""
+
+class ChatSearchIndex:
+    """Inverted index over chat messages, ranked with BM25.
+
+    Documents are identified by (session_id, position); message text is not
+    kept here, so snippets are cut by the caller from the stored message.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}  # term -> {doc id: term frequency}
+        self._docs: List[Optional[Tuple[str, int]]] = []  # doc id -> (session_id, position), None once removed
+        self._lengths: List[int] = []
+        self._session_docs: Dict[str, Dict[int, int]] = {}  # session_id -> {position: doc id}
+        self._total_length = 0
+        self._live_docs = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built = False
+
+    def __len__(self) -> int:
+        return self._live_docs
+
+    def add(self, session_id: str, position: int, text: str) -> None:
+        terms = tokenize(text)
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        with self._lock:
+            session_docs = self._session_docs.setdefault(session_id, {})
+            if position in session_docs:
+                return  # Already indexed, e.g. stored while the index was being built
+            doc_id = len(self._docs)
+            self._docs.append((session_id, position))
+            self._lengths.append(len(terms))
+            session_docs[position] = doc_id
+            self._total_length += len(terms)
+            self._live_docs += 1
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def add_many(self, messages: Iterable[Tuple[str, int, str]]) -> None:
+        for session_id, position, text in messages:
+            self.add(session_id, position, text)
+
+    def ensure_built(self, load: Callable[[], Iterable[Tuple[str, int, str]]]) -> None:
+        """Fill the index from load() once; concurrent callers wait for the first build"""
+        with self._build_lock:
+            if not self._built:
+                self.add_many(load())
+                self._built = True
+
+    def remove_session(self, session_id: str) -> None:
+        """Drop a session's messages; their postings are skipped at query time"""
+        with self._lock:
+            for doc_id in self._session_docs.pop(session_id, {}).values():
+                self._docs[doc_id] = None
+                self._total_length -= self._lengths[doc_id]
+                self._live_docs -= 1
+
+    def search(self, query: str, limit: int = 20) -> List[SearchHit]:
+        """Messages matching any query term, best BM25 score first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._live_docs:
+                return []
+            average_length = self._total_length / self._live_docs
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (self._live_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if self._docs[doc_id] is None:
+                        continue
+                    norm = self.K1 * (1 - self.B + self.B * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [SearchHit(*self._docs[doc_id], score=score) for doc_id, score in best]
+
+def make_snippet(text: str, query: str, width: int = 80) -> str:
+    """Cut a window of the text around the first query term it contains"""
+    folded = normalize(text)
+    # Folding can change the length, so only use match offsets when it did not
+    start = -1
+    if len(folded) == len(text):
+        for term in sorted(set(tokenize(query)), key=len, reverse=True):
+            start = folded.find(term)
+            if start >= 0:
+                break
+    begin = max(0, start - width // 3) if start >= 0 else 0
+    snippet = text[begin:begin + width].replace("\n", " ")
+    return ("…" if begin > 0 else "") + snippet + ("…" if begin + width < len(text) else "")
+
+_shared_indexes: "OrderedDict[Tuple, ChatSearchIndex]" = OrderedDict()
+_shared_indexes_lock = threading.Lock()
+
+def get_shared_index(key: Tuple, create: bool = True) -> Optional[ChatSearchIndex]:
+    """Process-wide index for one store and owner, shared by all of that owner's browser sessions.
+
+    Only the Config.SEARCH_INDEX_OWNERS most recently searched owners keep an
+    index in memory. With create=False, returns None instead of creating one.
+    """
+    with _shared_indexes_lock:
+        index = _shared_indexes.get(key)
+        if index is None:
+            if not create:
+                return None
+            index = _shared_indexes[key] = ChatSearchIndex()
+            while len(_shared_indexes) > Config.SEARCH_INDEX_OWNERS:
+                _shared_indexes.popitem(last=False)
+        _shared_indexes.move_to_end(key)
+        return index
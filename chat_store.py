@@ -0,0 +1,275 @@
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+from typing import Iterator, List, Dict, Optional, Tuple
+from config import Config
+from chat_message import ChatMessage, parse_timestamp
+from message_log import MessageLog
+
+class ChatStore(ABC):
+    """Storage backend for chat sessions.
+
+    Session headers (everything but the messages) are listed eagerly;
+    message bodies are only read when a session is opened.
+    """
+
+    @property
+    def index_key(self) -> Optional[Tuple]:
+        """Identifies this store's history across the process, so the search index can be shared.
+
+        None for stores whose contents are private to one ChatManager.
+        """
+        return None
+
+    @abstractmethod
+    def save_session(self, session) -> None:
+        """Insert or update a session header"""
+
+    @abstractmethod
+    def append_message(self, session_id: str, message: ChatMessage) -> None:
+        ...
+
+    @abstractmethod
+    def list_sessions(self) -> List[Dict]:
+        """Session headers ordered by creation time, oldest first"""
+
+    @abstractmethod
+    def load_messages(self, session_id: str) -> List[ChatMessage]:
+        ...
+
+    @abstractmethod
+    def load_message(self, session_id: str, position: int) -> Optional[ChatMessage]:
+        """A single message by its index within the session"""
+
+    @abstractmethod
+    def iter_session_messages(self, session_id: str) -> Iterator[ChatMessage]:
+        """A session's messages in order, without holding them all in memory"""
+
+    @abstractmethod
+    def iter_messages(self) -> Iterator[Tuple[str, int, str]]:
+        """(session_id, position, content) of every stored message, for building the search index"""
+
+    @abstractmethod
+    def delete_session(self, session_id: str) -> None:
+        ...
+
+class MemoryChatStore(ChatStore):
+    """Non-durable store; history is lost when the process exits.
+
+    Each session's messages are kept in a MessageLog of their own, so past
+    the memory cap they spill to disk like the session's log does.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+        self._messages: Dict[str, MessageLog] = {}
+
+    def save_session(self, session) -> None:
+        self._sessions[session.id] = _session_header(session)
+        self._messages.setdefault(session.id, MessageLog())
+
+    def append_message(self, session_id: str, message: ChatMessage) -> None:
+        self._messages.setdefault(session_id, MessageLog()).append(message)
+
+    def list_sessions(self) -> List[Dict]:
+        return sorted(self._sessions.values(), key=lambda header: header["created_at"])
+
+    def load_messages(self, session_id: str) -> List[ChatMessage]:
+        return list(self._messages.get(session_id, ()))
+
+    def load_message(self, session_id: str, position: int) -> Optional[ChatMessage]:
+        messages = self._messages.get(session_id, ())
+        return messages[position] if 0 <= position < len(messages) else None
+
+    def iter_session_messages(self, session_id: str) -> Iterator[ChatMessage]:
+        # Spilled messages are read back one at a time
+        return iter(self._messages.get(session_id, ()))
+
+    def iter_messages(self) -> Iterator[Tuple[str, int, str]]:
+        for session_id, messages in list(self._messages.items()):
+            for position, message in enumerate(messages):
+                yield session_id, position, message.content
+
+    def delete_session(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        messages = self._messages.pop(session_id, None)
+        if messages is not None:
+            messages.close()
+
+class SQLiteChatStore(ChatStore):
+    """Durable store in an embedded SQLite database using write-ahead logging.
+
+    Every query is scoped to the owner the store was opened for; sessions of
+    other owners can be neither listed nor read, written or deleted.
+    """
+
+    # Messages of the given session id, provided the session belongs to the given owner
+    _OWNED_SESSION = "session_id = (SELECT id FROM sessions WHERE id = ? AND owner = ?)"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            system_prompt TEXT NOT NULL DEFAULT '',
+            model TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL,
+            context_summary TEXT,
+            summary_watermark INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            tokens INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_owner_created_at ON sessions(owner, created_at);
+        CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id);
+        CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at);
+    """
+
+    def __init__(self, owner: str, db_path: str = None):
+        if not owner:
+            raise ValueError("SQLiteChatStore needs an owner to scope the history to")
+        self.db_path = db_path or Config.CHAT_DB_PATH
+        self.owner = owner
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Background summary threads write through the same connection
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("PRAGMA foreign_keys=ON")
+            self._db.executescript(self.SCHEMA)
+            self._db.commit()
+
+    @property
+    def index_key(self) -> Optional[Tuple]:
+        return "sqlite", os.path.abspath(self.db_path), self.owner
+
+    def save_session(self, session) -> None:
+        header = _session_header(session)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO sessions (id, owner, system_prompt, model, created_at, context_summary, summary_watermark) "
+                "VALUES (:id, :owner, :system_prompt, :model, :created_at, :context_summary, :summary_watermark) "
+                "ON CONFLICT(id) DO UPDATE SET system_prompt = excluded.system_prompt, model = excluded.model, "
+                "context_summary = excluded.context_summary, summary_watermark = excluded.summary_watermark "
+                "WHERE sessions.owner = excluded.owner",
+                {**header, "owner": self.owner}
+            )
+            self._db.commit()
+
+    def append_message(self, session_id: str, message: ChatMessage) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO messages (session_id, role, content, created_at, tokens) "
+                "SELECT id, ?, ?, ?, ? FROM sessions WHERE id = ? AND owner = ?",
+                (message.role, message.content, message.created_at, message.tokens, session_id, self.owner)
+            )
+            self._db.commit()
+
+    def list_sessions(self) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, system_prompt, model, created_at, context_summary, summary_watermark "
+                "FROM sessions WHERE owner = ? ORDER BY created_at, id",
+                (self.owner,)
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "system_prompt": row[1],
+                "model": row[2],
+                "created_at": row[3],
+                "context_summary": row[4],
+                "summary_watermark": row[5]
+            }
+            for row in rows
+        ]
+
+    def load_messages(self, session_id: str) -> List[ChatMessage]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT role, content, created_at, tokens FROM messages WHERE {self._OWNED_SESSION} ORDER BY id",
+                (session_id, self.owner)
+            ).fetchall()
+        # Databases written before epoch timestamps hold "%Y-%m-%d %H:%M:%S" strings
+        return [
+            ChatMessage(role, content, parse_timestamp(created_at), tokens)
+            for role, content, created_at, tokens in rows
+        ]
+
+    def load_message(self, session_id: str, position: int) -> Optional[ChatMessage]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT role, content, created_at, tokens FROM messages WHERE {self._OWNED_SESSION} "
+                "ORDER BY id LIMIT 1 OFFSET ?",
+                (session_id, self.owner, position)
+            ).fetchone()
+        if row is None:
+            return None
+        role, content, created_at, tokens = row
+        return ChatMessage(role, content, parse_timestamp(created_at), tokens)
+
+    def iter_session_messages(self, session_id: str, batch_size: int = 500) -> Iterator[ChatMessage]:
+        # Page by rowid so the lock is released between batches and only one batch is in memory
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, role, content, created_at, tokens FROM messages "
+                    f"WHERE {self._OWNED_SESSION} AND id > ? ORDER BY id LIMIT ?",
+                    (session_id, self.owner, last_id, batch_size)
+                ).fetchall()
+            for row_id, role, content, created_at, tokens in rows:
+                yield ChatMessage(role, content, parse_timestamp(created_at), tokens)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def iter_messages(self) -> Iterator[Tuple[str, int, str]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT m.session_id, m.content FROM messages m JOIN sessions s ON s.id = m.session_id "
+                "WHERE s.owner = ? ORDER BY m.session_id, m.id",
+                (self.owner,)
+            ).fetchall()
+        position = 0
+        previous_session = None
+        for session_id, content in rows:
+            position = position + 1 if session_id == previous_session else 0
+            previous_session = session_id
+            yield session_id, position, content
+
+    def delete_session(self, session_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ? AND owner = ?", (session_id, self.owner))
+            self._db.commit()
+
+def _session_header(session) -> Dict:
+    return {
+        "id": session.id,
+        "system_prompt": session.system_prompt,
+        "model": session.model,
+        "created_at": session.created_at,
+        "context_summary": session.context_summary,
+        "summary_watermark": session.summary_watermark
+    }
+
+def create_chat_store(owner: Optional[str]) -> ChatStore:
+    """Build the backend selected by Config.CHAT_STORE_BACKEND.
+
+    History is only persisted for an identified owner; without one it is
+    kept in memory for the browser session, so users never share a history.
+    """
+    if Config.CHAT_STORE_BACKEND == "sqlite" and owner:
+        try:
+            return SQLiteChatStore(owner=owner)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open chat history database, history will not persist: {str(e)}")
+    return MemoryChatStore()
@@ -12,6 +12,57 @@ class Config:
     CLAUDE_MODEL = "anthropic/claude-3.5-sonnet"
     OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
 
+    # Display name -> provider model id
+    AVAILABLE_MODELS = {
+        "GPT-4": OPENAI_MODEL,
+        "Gemini-2.0": GEMINI_MODEL,
+        "Claude-3.5": CLAUDE_MODEL
+    }
+
+    # Client-side rate limits, keyed by provider or by model id (model entries win)
+    RATE_LIMITS = {
+        "openai": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+        "openrouter": {"requests_per_minute": 200, "tokens_per_minute": None},
+        GEMINI_MODEL: {"requests_per_minute": 20, "tokens_per_minute": None}  # Free tier
+    }
+    RATE_LIMIT_MAX_WAIT = 3  # Seconds a request may queue before failing fast (and failing over)
+    RATE_LIMIT_JITTER = 0.25  # Seconds of random spread added to queued requests
+    RETRY_MAX_DELAY = 8  # Cap on exponential backoff between retries
+
+    # Response cache settings
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_PATH = "cache/responses.sqlite3"
+    RESPONSE_CACHE_TTL = 24 * 60 * 60  # Seconds; 0 disables expiry
+    RESPONSE_CACHE_MEMORY_ENTRIES = 256  # In-process LRU tier
+    RESPONSE_CACHE_DISK_ENTRIES = 10000  # SQLite tier
+    RESPONSE_CACHE_EVICT_EVERY = 100  # Disk writes between eviction passes
+
+    # Failover routing settings
+    FAILOVER_PRIORITY = ["Gemini-2.0", "Claude-3.5", "GPT-4"]  # Fallback order
+    ROUTER_LATENCY_WINDOW = 50  # Recent calls used for p50/p95 and error rate
+    CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive failures that open the circuit
+    CIRCUIT_ERROR_RATE = 0.5  # Error rate over the window that opens the circuit
+    CIRCUIT_MIN_SAMPLES = 5  # Calls needed before the error rate is considered
+    CIRCUIT_COOLDOWN = 30  # Seconds before an open circuit allows a trial request
+
+    # Instrumentation settings
+    METRICS_ENABLED = True
+    METRICS_HOST = "127.0.0.1"  # /metrics is only reachable locally
+    METRICS_PORT = 9464
+    METRICS_LOG_PATH = ""  # JSON call logs go to stderr when empty
+    METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+    # Compare mode settings
+    COMPARE_MAX_CONCURRENCY = 3  # Models queried at the same time
+    COMPARE_TIMEOUT = 60  # Seconds to wait for each model
+
+    # HTTP connection pool settings (shared by every session in the process)
+    OPENROUTER_POOL_CONNECTIONS = 4  # Number of per-host pools to cache
+    OPENROUTER_POOL_MAXSIZE = 16  # Maximum keep-alive connections per host
+    OPENROUTER_POOL_IDLE_TIMEOUT = 90  # Seconds before idle connections are dropped
+    OPENROUTER_POOL_TIMEOUT = RATE_LIMIT_MAX_WAIT  # Seconds to wait for a free connection before failing fast
+    OPENROUTER_REQUEST_TIMEOUT = 30  # Seconds
+
     SUPPORTED_LANGUAGES = ["en", "ja"]
     DEFAULT_LANGUAGE = "ja"  # Changed from "en" to "ja"
 
@@ -29,11 +80,48 @@ class Config:
         "Pacific/Auckland"
     ]
 
+    # Chat history storage
+    CHAT_STORE_BACKEND = "sqlite"  # "sqlite" (durable) or "memory"
+    CHAT_DB_PATH = "data/chat_history.sqlite3"
+    BROWSER_ID_COOKIE = "mychatme_browser_id"  # Identifies the history of visitors who are not logged in
+    BROWSER_ID_MAX_AGE = 365 * 24 * 60 * 60  # Seconds the browser id cookie is kept
+    SESSION_MEMORY_MAX_BYTES = 4 * 1024 * 1024  # Message text kept in memory per session; older messages spill
+    SPILL_DIR = "data/spill"  # Temporary files holding spilled messages
+    SEARCH_INDEX_OWNERS = 32  # Owners whose history search index is kept in memory per process
+    EXPORT_ARCHIVE_FORMAT = "zip"  # Bulk history export: "zip" or "tar.gz"
+    EXPORT_BATCH_MESSAGES = 500  # Messages read and timestamp-formatted together during exports
+    PDF_EXPORT_WORKERS = 2  # Processes rendering PDF exports in the background
+    PDF_MAX_PARAGRAPH_CHARS = 2000  # Longer messages are split into several paragraphs
+    PDF_STORY_BUFFER = 64  # Flowables held ahead of the page being laid out
+
     # Chat context settings
-    MAX_HISTORY_CHATS = 10
+    MAX_HISTORY_CHATS = 10  # History sessions whose messages are kept in memory
     MAX_CONTEXT_LENGTH = 4096  # Maximum token length for context
     MEMORY_SUMMARY_TOKENS = 150  # Length of conversation summaries
+    SUMMARY_INTERVAL_MESSAGES = 5  # Summarize after every N messages
+    SUMMARY_WORKERS = 4  # Background threads generating summaries
+    ROLLING_SUMMARY = True  # Extend the previous summary with new messages only
     CONTEXT_WINDOW_MESSAGES = 10  # Number of messages to keep in immediate context
+    # Chat pane
+    CHAT_PAGE_SIZE = 20  # Messages shown at first and added by each "load older" click
+
+    # Prompt templates: templates.json plus an append-only journal of later changes
+    TEMPLATE_DIR = "templates"
+    TEMPLATE_JOURNAL_COMPACT_ENTRIES = 200  # Journal entries after which templates.json is rewritten
+    TEMPLATE_PAGE_SIZE = 20  # Templates listed per page in the template manager
+
+    # Retrieval of older messages that have left the context window
+    SEMANTIC_MEMORY_ENABLED = True
+    MEMORY_VECTOR_DIM = 128  # Hashed n-gram features per message (512 bytes of float32)
+    MEMORY_TOP_K = 3  # Older messages recalled per request
+    MEMORY_MIN_SIMILARITY = 0.2  # Cosine similarity below which nothing is recalled
+    MEMORY_MAX_TOKENS = 1024  # Token budget for recalled messages
+    # Prompt token budget per model (display name); others use MAX_CONTEXT_LENGTH
+    MODEL_CONTEXT_BUDGETS = {
+        "GPT-4": MAX_CONTEXT_LENGTH,
+        "Gemini-2.0": MAX_CONTEXT_LENGTH * 2,
+        "Claude-3.5": MAX_CONTEXT_LENGTH * 2
+    }
 
     @staticmethod
     def get_openai_key():
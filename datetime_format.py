@@ -0,0 +1,46 @@
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, List, Union
+import pytz
+from config import Config
+from chat_message import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+DISPLAY_FORMAT = "%Y-%m-%d %H:%M:%S %Z"
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str = None) -> pytz.BaseTzInfo:
+    """Resolve a timezone name once; unknown names fall back to the default timezone"""
+    try:
+        return pytz.timezone(name or Config.DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        logger.warning("Unknown timezone %r, using %s", name, Config.DEFAULT_TIMEZONE)
+        return pytz.timezone(Config.DEFAULT_TIMEZONE)
+
+def format_epoch(epoch: int, timezone: str = None) -> str:
+    """Format a UTC epoch timestamp in the given timezone, memoized per (epoch, timezone)"""
+    return _format_in(epoch, get_timezone(timezone))
+
+def format_timestamp(value: Union[int, str], timezone: str = None) -> str:
+    """Format an epoch timestamp or a legacy UTC datetime string; unparseable values are returned as is"""
+    try:
+        epoch = value if isinstance(value, int) else parse_timestamp(value)
+        return format_epoch(epoch, timezone)
+    except (ValueError, OverflowError, OSError) as e:
+        logger.warning("Could not format timestamp %r: %s", value, e)
+        return str(value)
+
+def format_timestamps(epochs: Iterable[int], timezone: str = None) -> List[str]:
+    """Format a whole session's timestamps in one pass.
+
+    The timezone is resolved once for the batch instead of per message, and
+    each (epoch, timezone) pair is converted once across repeated exports.
+    """
+    tz = get_timezone(timezone)
+    return [_format_in(epoch, tz) for epoch in epochs]
+
+@lru_cache(maxsize=8192)
+def _format_in(epoch: int, tz: pytz.BaseTzInfo) -> str:
+    return datetime.fromtimestamp(epoch, pytz.utc).astimezone(tz).strftime(DISPLAY_FORMAT)
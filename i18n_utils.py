@@ -1,24 +1,25 @@
 import json
 import os
+from functools import lru_cache
 from typing import Dict
 from config import Config
 
-class I18nManager:
-    _instance = None
-    _translations: Dict[str, Dict] = {}
-    _current_language = Config.DEFAULT_LANGUAGE
+@lru_cache(maxsize=None)
+def load_translations() -> Dict[str, Dict]:
+    """Read every locale catalog once per process; the result is shared and must not be modified"""
+    translations = {}
+    for lang in Config.SUPPORTED_LANGUAGES:
+        file_path = f"locales/{lang}/translation.json"
+        with open(file_path, "r", encoding="utf-8") as f:
+            translations[lang] = json.load(f)
+    return translations
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(I18nManager, cls).__new__(cls)
-            cls._instance._load_translations()
-        return cls._instance
+class I18nManager:
+    """A user's language selection over the shared locale catalogs"""
 
-    def _load_translations(self):
-        for lang in Config.SUPPORTED_LANGUAGES:
-            file_path = f"locales/{lang}/translation.json"
-            with open(file_path, "r", encoding="utf-8") as f:
-                self._translations[lang] = json.load(f)
+    def __init__(self):
+        self._translations = load_translations()
+        self._current_language = Config.DEFAULT_LANGUAGE
 
     def set_language(self, language: str):
         if language in Config.SUPPORTED_LANGUAGES:
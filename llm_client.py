@@ -1,38 +1,80 @@
 import os
-from typing import List, Dict
-import openai
+import threading
+import time
+from typing import TYPE_CHECKING, List, Dict, Iterator, Optional, Callable
 from config import Config
 from openrouter_client import OpenRouterClient
+from response_cache import ResponseCache
+from rate_limiter import get_rate_limiter, backoff_delay, parse_retry_after
+from token_counter import count_messages_tokens
+from metrics import CallRecord, record_call
+
+# The openai SDK is the slowest import in the app, so it is only loaded on the first OpenAI call
+if TYPE_CHECKING:
+    import openai
+
+_shared_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+def _get_shared_client(name: str, factory: Callable[[], object]):
+    """Create a client once per process; failures are not cached so a later call can retry"""
+    with _clients_lock:
+        client = _shared_clients.get(name)
+        if client is None:
+            client = _shared_clients[name] = factory()
+        return client
+
+def get_openai_client() -> Optional["openai.OpenAI"]:
+    """Process-wide OpenAI client, or None without an API key. The client is thread-safe."""
+    openai_key = Config.get_openai_key()
+    if not openai_key:
+        return None
+    import openai
+    # Retries go through _call_openai so they are paced by the rate limiter
+    return _get_shared_client("openai", lambda: openai.OpenAI(api_key=openai_key, max_retries=0))
+
+def get_openrouter_client() -> Optional[OpenRouterClient]:
+    """Process-wide OpenRouter client, or None without an API key"""
+    if not Config.get_openrouter_key():
+        return None
+    return _get_shared_client("openrouter", OpenRouterClient)
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide response cache, so every user's sessions share both tiers"""
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return None
+    return _get_shared_client("response_cache", ResponseCache)
 
 class LLMClient:
+    """A user's view of the shared API clients: test mode and the last call's stats are per user"""
+
     def __init__(self):
-        self.openai_client = None
         self.openrouter_client = None
         self.test_mode = False  # For testing error scenarios
+        self.max_retries = 3
+        self.retry_delay = 1  # Initial backoff in seconds
+        self.last_call: Optional[CallRecord] = None  # Instrumentation of the most recent call
+        self.cache = get_response_cache()
         self.initialize_clients()
 
     def initialize_clients(self):
-        """Initialize API clients with proper error handling"""
+        """Look up the shared API clients with proper error handling"""
         try:
-            openai_key = Config.get_openai_key()
-            openrouter_key = Config.get_openrouter_key()
-
-            if openai_key:
-                self.openai_client = openai.OpenAI(api_key=openai_key)
-            if openrouter_key:
-                self.openrouter_client = OpenRouterClient()
+            self.openrouter_client = get_openrouter_client()
         except Exception as e:
             print(f"Error initializing API clients: {str(e)}")
 
+    @property
+    def openai_client(self) -> Optional["openai.OpenAI"]:
+        """The shared OpenAI client, created on first use"""
+        return get_openai_client()
+
     def set_test_mode(self, enabled: bool = True):
         """Enable or disable test mode for simulating errors"""
         self.test_mode = enabled
 
-    def chat_openai(self, messages: List[Dict[str, str]]) -> str:
-        """Send chat completion request to OpenAI API"""
-        if not self.openai_client:
-            raise ValueError("OpenAI client not initialized. Please check your API key.")
-
+    def _raise_test_error(self, messages: List[Dict[str, str]]) -> None:
+        """Raise the error requested by a "test_error ..." message in test mode"""
         if self.test_mode:
             if messages and "test_error" in messages[-1].get("content", "").lower():
                 error_type = messages[-1]["content"].lower()
@@ -43,66 +85,265 @@ class LLMClient:
                 elif "network" in error_type:
                     raise Exception("Network connection error")
 
+    def _call_openai(self, messages: List[Dict[str, str]], record: CallRecord, **kwargs):
+        """Call the OpenAI chat completions API, paced by the rate limiter and retried with backoff"""
+        import openai
+        limiter = get_rate_limiter("openai", Config.OPENAI_MODEL)
+        tokens = count_messages_tokens(messages) + kwargs.get("max_tokens", 0)
+
+        for attempt in range(self.max_retries):
+            record.queue_wait += limiter.acquire(tokens)
+            record.retries = attempt
+            last_attempt = attempt == self.max_retries - 1
+            try:
+                start = time.perf_counter()
+                response = self.openai_client.chat.completions.create(
+                    model=Config.OPENAI_MODEL,
+                    messages=messages,
+                    **kwargs
+                )
+                # A stream is returned as soon as the headers arrive
+                record.connect_time = time.perf_counter() - start if kwargs.get("stream") else None
+                return response
+            except openai.RateLimitError as e:
+                headers = e.response.headers
+                delay = parse_retry_after(headers.get("retry-after"))
+                if delay is None and headers.get("retry-after-ms"):
+                    delay = float(headers["retry-after-ms"]) / 1000
+                if delay is None:
+                    delay = backoff_delay(self.retry_delay, attempt)
+                limiter.block_for(delay)
+                if last_attempt or delay > Config.RATE_LIMIT_MAX_WAIT:
+                    raise Exception(f"OpenAI API error: Rate limit exceeded ({str(e)})")
+                print(f"OpenAI rate limit exceeded. Retrying in {delay:.1f} seconds...")
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                if last_attempt:
+                    raise Exception(f"OpenAI API error: {str(e)}")
+                # The request thread sleeps here, so never longer than a queued request may wait
+                time.sleep(backoff_delay(self.retry_delay, attempt, cap=Config.RATE_LIMIT_MAX_WAIT))
+
+    @staticmethod
+    def _record_usage(record: CallRecord, usage) -> None:
+        """Copy token usage reported by the OpenAI SDK onto the call record"""
+        if usage is not None:
+            record.prompt_tokens = usage.prompt_tokens
+            record.completion_tokens = usage.completion_tokens
+
+    def _cache_key(self, model: str, messages: List[Dict[str, str]], openrouter: bool = False) -> Optional[str]:
+        """Cache key for a request, using the sampling parameters the provider will see"""
+        if not self.cache:
+            return None
+        if not openrouter:
+            return ResponseCache.make_key(model, messages)
+        return ResponseCache.make_key(
+            model, messages,
+            temperature=self.openrouter_client.temperature,
+            max_tokens=self.openrouter_client.max_tokens
+        )
+
+    def _cached_call(self, key: Optional[str], call: Callable[[], str], bypass_cache: bool,
+                     record: CallRecord) -> str:
+        """Return a cached response, or make the call and cache its result"""
+        self.last_call = record
+        start = time.perf_counter()
         try:
-            response = self.openai_client.chat.completions.create(
-                model=Config.OPENAI_MODEL,
-                messages=messages
-            )
-            return response.choices[0].message.content
-        except openai.APIError as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            if key and not bypass_cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    record.cache_hit = True
+                    return cached
+            response = call()
+            if key:
+                self.cache.set(key, response)
+            return response
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            record.total_time = time.perf_counter() - start
+            record_call(record)
 
-    def chat_gemini(self, messages: List[Dict[str, str]]) -> str:
-        """Send chat completion request to Gemini via OpenRouter"""
-        if not self.openrouter_client:
-            raise ValueError("OpenRouter client not initialized. Please check your API key.")
+    def _cached_stream(self, key: Optional[str], chunks: Iterator[str], bypass_cache: bool,
+                       record: CallRecord) -> Iterator[str]:
+        """Replay a cached response as one chunk, or stream and cache the completed text"""
+        if key and not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                record.cache_hit = True
+                chunks.close()  # Never started, so no request is sent
+                yield cached
+                return
+
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        if key:
+            self.cache.set(key, "".join(parts))
 
+    def _track_stream(self, record: CallRecord, chunks: Iterator[str]) -> Iterator[str]:
+        """Pass chunks through while recording time-to-first-token and total time"""
+        self.last_call = record
+        start = time.perf_counter()
         try:
-            return self.openrouter_client.create(
-                messages=messages,
-                model=Config.GEMINI_MODEL
-            )
+            for chunk in chunks:
+                if record.ttft is None:
+                    record.ttft = time.perf_counter() - start
+                record.chunks += 1
+                yield chunk
         except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+            record.error = str(e)
+            raise
+        finally:
+            # Also runs when the consumer stops early and the generator is closed
+            record.total_time = time.perf_counter() - start
+            record_call(record)
+
+    def chat_openai(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> str:
+        """Send chat completion request to OpenAI API"""
+        if not self.openai_client:
+            raise ValueError("OpenAI client not initialized. Please check your API key.")
+
+        self._raise_test_error(messages)
 
-    def chat_claude(self, messages: List[Dict[str, str]]) -> str:
+        record = CallRecord(provider="openai", model=Config.OPENAI_MODEL)
+
+        def call() -> str:
+            import openai
+            try:
+                response = self._call_openai(messages, record)
+                self._record_usage(record, response.usage)
+                return response.choices[0].message.content
+            except openai.APIError as e:
+                raise Exception(f"OpenAI API error: {str(e)}")
+
+        return self._cached_call(self._cache_key(Config.OPENAI_MODEL, messages), call, bypass_cache, record)
+
+    def _chat_openrouter(self, messages: List[Dict[str, str]], model: str, label: str,
+                         bypass_cache: bool = False) -> str:
+        """Send chat completion request to a model hosted on OpenRouter"""
+        if not self.openrouter_client:
+            raise ValueError("OpenRouter client not initialized. Please check your API key.")
+
+        record = CallRecord(provider="openrouter", model=model)
+
+        def call() -> str:
+            try:
+                return self.openrouter_client.create(
+                    messages=messages,
+                    model=model,
+                    record=record
+                )
+            except Exception as e:
+                raise Exception(f"{label} API error: {str(e)}")
+
+        return self._cached_call(self._cache_key(model, messages, openrouter=True), call, bypass_cache, record)
+
+    def chat_gemini(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> str:
+        """Send chat completion request to Gemini via OpenRouter"""
+        return self._chat_openrouter(messages, Config.GEMINI_MODEL, "Gemini", bypass_cache)
+
+    def chat_claude(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> str:
         """Send chat completion request to Claude via OpenRouter"""
+        return self._chat_openrouter(messages, Config.CLAUDE_MODEL, "Claude", bypass_cache)
+
+    def stream_openai(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> Iterator[str]:
+        """Stream a chat completion from OpenAI API, yielding tokens as they arrive"""
+        if not self.openai_client:
+            raise ValueError("OpenAI client not initialized. Please check your API key.")
+
+        self._raise_test_error(messages)
+
+        record = CallRecord(provider="openai", model=Config.OPENAI_MODEL, kind="stream")
+
+        def chunks() -> Iterator[str]:
+            import openai
+            try:
+                # include_usage adds a final chunk carrying token usage and no choices
+                stream = self._call_openai(messages, record, stream=True, stream_options={"include_usage": True})
+                for chunk in stream:
+                    if chunk.usage:
+                        self._record_usage(record, chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except openai.APIError as e:
+                raise Exception(f"OpenAI API error: {str(e)}")
+
+        key = self._cache_key(Config.OPENAI_MODEL, messages)
+        return self._track_stream(record, self._cached_stream(key, chunks(), bypass_cache, record))
+
+    def _stream_openrouter(self, messages: List[Dict[str, str]], model: str, label: str,
+                           bypass_cache: bool = False) -> Iterator[str]:
+        """Stream a chat completion from a model hosted on OpenRouter"""
         if not self.openrouter_client:
             raise ValueError("OpenRouter client not initialized. Please check your API key.")
 
-        try:
-            return self.openrouter_client.create(
-                messages=messages,
-                model=Config.CLAUDE_MODEL
-            )
-        except Exception as e:
-            raise Exception(f"Claude API error: {str(e)}")
+        record = CallRecord(provider="openrouter", model=model, kind="stream")
+
+        def chunks() -> Iterator[str]:
+            try:
+                yield from self.openrouter_client.stream(messages=messages, model=model, record=record)
+            except Exception as e:
+                raise Exception(f"{label} API error: {str(e)}")
+
+        key = self._cache_key(model, messages, openrouter=True)
+        return self._track_stream(record, self._cached_stream(key, chunks(), bypass_cache, record))
+
+    def stream_gemini(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> Iterator[str]:
+        """Stream a chat completion from Gemini via OpenRouter"""
+        return self._stream_openrouter(messages, Config.GEMINI_MODEL, "Gemini", bypass_cache)
 
-    def generate_context_summary(self, messages: List[Dict[str, str]]) -> str:
-        """Generate a summary of the conversation context."""
+    def stream_claude(self, messages: List[Dict[str, str]], bypass_cache: bool = False) -> Iterator[str]:
+        """Stream a chat completion from Claude via OpenRouter"""
+        return self._stream_openrouter(messages, Config.CLAUDE_MODEL, "Claude", bypass_cache)
+
+    def generate_context_summary(self, messages: List[Dict[str, str]], previous_summary: Optional[str] = None) -> str:
+        """Generate a summary of the conversation context.
+
+        With previous_summary, only the messages added since that summary are
+        sent and the model folds them into it (rolling summary).
+        """
         if not self.openai_client:
             print("OpenAI client not initialized. Skipping context summary.")
             return ""
 
+        record = CallRecord(provider="openai", model=Config.OPENAI_MODEL, kind="summary")
+        start = time.perf_counter()
         try:
-            summary_prompt = {
-                "role": "system",
-                "content": (
-                    "Summarize the key points of this conversation in a concise way. "
-                    "Focus on the main topics and important details. "
-                    f"Keep the summary within {Config.MEMORY_SUMMARY_TOKENS} tokens."
-                )
-            }
+            if previous_summary:
+                summary_prompt = {
+                    "role": "system",
+                    "content": (
+                        "Update the running summary of this conversation with the new messages below. "
+                        "Keep the main topics and important details from both, dropping what is no longer relevant. "
+                        f"Keep the summary within {Config.MEMORY_SUMMARY_TOKENS} tokens.\n\n"
+                        f"Current summary: {previous_summary}"
+                    )
+                }
+                new_messages = messages
+            else:
+                summary_prompt = {
+                    "role": "system",
+                    "content": (
+                        "Summarize the key points of this conversation in a concise way. "
+                        "Focus on the main topics and important details. "
+                        f"Keep the summary within {Config.MEMORY_SUMMARY_TOKENS} tokens."
+                    )
+                }
+                new_messages = messages[-Config.CONTEXT_WINDOW_MESSAGES:]
 
             # Create a list of messages for summarization
-            summary_messages = [summary_prompt] + messages[-Config.CONTEXT_WINDOW_MESSAGES:]
+            summary_messages = [summary_prompt] + [
+                {"role": msg["role"], "content": msg["content"]} for msg in new_messages
+            ]
 
-            response = self.openai_client.chat.completions.create(
-                model=Config.OPENAI_MODEL,
-                messages=summary_messages,
-                max_tokens=Config.MEMORY_SUMMARY_TOKENS
-            )
+            response = self._call_openai(summary_messages, record, max_tokens=Config.MEMORY_SUMMARY_TOKENS)
+            self._record_usage(record, response.usage)
             return response.choices[0].message.content
         except Exception as e:
             print(f"Failed to generate context summary: {str(e)}")
-            return ""  # Return empty string if summarization fails
\ No newline at end of file
+            record.error = str(e)
+            return ""  # Return empty string if summarization fails
+        finally:
+            record.total_time = time.perf_counter() - start
+            record_call(record)
@@ -1,9 +1,19 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import hashlib
 import os
+import re
+import secrets
 from chat_manager import ChatManager
 from llm_client import LLMClient
+from async_llm_client import AsyncLLMClient
+from summary_worker import SummaryScheduler
+from pdf_export import PdfExportQueue
+from rate_limiter import all_rate_limiters
+from model_router import ModelRouter
+from metrics import start_metrics_server
 from i18n_utils import I18nManager
-from ui_components import render_message, render_sidebar, show_notification
+from ui_components import render_chat_pane, render_message, render_message_stream, render_sidebar, show_notification
 from config import Config
 from prompt_template import PromptTemplateManager
 
@@ -20,11 +30,67 @@ st.set_page_config(
     }
 )
 
+# Expose Prometheus metrics for every LLM call in this process
+start_metrics_server()
+
+@st.cache_resource
+def get_async_llm_client() -> AsyncLLMClient:
+    """比較モード用クライアント（状態を持たないので全セッションで共有）"""
+    return AsyncLLMClient()
+
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    """フェイルオーバー用ルーター（レイテンシ・エラー率・サーキットの状態を全セッションで共有）"""
+    return ModelRouter()
+
+@st.cache_resource
+def get_template_manager() -> PromptTemplateManager:
+    """テンプレートストア（templates.json の読み込みはプロセスごとに一度だけ）"""
+    return PromptTemplateManager()
+
+BROWSER_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{43}")  # secrets.token_urlsafe(32)
+
+def browser_id() -> str:
+    """このブラウザの ID。Cookie に保存するので、再読み込みや再起動の後も同じ履歴を開ける"""
+    cookie = st.context.cookies.get(Config.BROWSER_ID_COOKIE)
+    # AppTest などブラウザのない実行では cookies が文字列を返さない
+    if isinstance(cookie, str) and BROWSER_ID_PATTERN.fullmatch(cookie):
+        return cookie
+    new_id = secrets.token_urlsafe(32)
+    # st.context.cookies は読み取り専用なので、同じオリジンで動く iframe のスクリプトから書き込む
+    script = (
+        f"<script>document.cookie = '{Config.BROWSER_ID_COOKIE}={new_id}; "
+        f"max-age={Config.BROWSER_ID_MAX_AGE}; path=/; SameSite=Strict';</script>"
+    )
+    if hasattr(st, "iframe"):
+        st.iframe(script, height="content")
+    else:  # Older Streamlit without st.iframe
+        components.html(script, height=0)
+    return new_id
+
+def current_owner() -> str:
+    """チャット履歴の持ち主。ログインしていればそのユーザー、していなければこのブラウザ"""
+    user = getattr(st, "user", None) or {}
+    if user.get("is_logged_in"):
+        return user.get("sub") or user.get("email")
+    # Cookie の値そのものは保存しない（データベースを読めても他人の履歴は開けない）
+    return "browser:" + hashlib.sha256(browser_id().encode()).hexdigest()
+
 # Initialize session state
+# API clients, locale catalogs and templates are shared by every browser session in the process;
+# only the per-user chat state below is created per session
 if "chat_manager" not in st.session_state:
-    st.session_state.chat_manager = ChatManager()
+    st.session_state.chat_manager = ChatManager(current_owner())
 if "llm_client" not in st.session_state:
     st.session_state.llm_client = LLMClient()
+if "async_llm_client" not in st.session_state:
+    st.session_state.async_llm_client = get_async_llm_client()
+if "model_router" not in st.session_state:
+    st.session_state.model_router = get_model_router()
+if "pdf_export_queue" not in st.session_state:
+    st.session_state.pdf_export_queue = PdfExportQueue()
+if "summary_scheduler" not in st.session_state:
+    st.session_state.summary_scheduler = SummaryScheduler(st.session_state.llm_client)
 if "i18n" not in st.session_state:
     st.session_state.i18n = I18nManager()
 if "sidebar_state" not in st.session_state:
@@ -32,23 +98,67 @@ if "sidebar_state" not in st.session_state:
 if "test_mode" not in st.session_state:
     st.session_state.test_mode = False
 if "template_manager" not in st.session_state:
-    st.session_state.template_manager = PromptTemplateManager()
+    st.session_state.template_manager = get_template_manager()
+
+def show_template_page(page):
+    """検索語やページが変わったら、前のページで選んでいたテンプレートの選択を外す"""
+    st.session_state.template_page = page
+    st.session_state.pop("template_selector", None)
 
+@st.fragment
 def render_template_manager(i18n):
-    """プロンプトテンプレート管理セクションを表示"""
+    """プロンプトテンプレート管理セクションを表示（操作してもこのフラグメントだけが再実行される）"""
+    template_manager = st.session_state.template_manager
+    page_size = Config.TEMPLATE_PAGE_SIZE
     with st.expander(i18n.get_text("prompt_templates")):
-        # テンプレート一覧表示と選択
-        templates = st.session_state.template_manager.list_templates()
-        if templates:
-            template_names = [f"{t['name']} ({t['created_at']})" for t in templates]
-            selected_template = st.selectbox(
-                i18n.get_text("select_template"),
-                [""] + template_names,
-                key="template_selector"
+        selected_template = None
+        if len(template_manager):
+            query = st.text_input(
+                i18n.get_text("search_templates"),
+                key="template_search",
+                on_change=show_template_page,
+                args=(0,)
             )
+            # 全件ではなく、表示するページ分のテンプレートだけを取り出す
+            page = st.session_state.get("template_page", 0)
+            templates, total = template_manager.search_templates(query, offset=page * page_size, limit=page_size)
+            pages = max(1, -(-total // page_size))
+            if page >= pages:
+                # 削除などで最後のページが無くなった
+                page = st.session_state.template_page = pages - 1
+                templates, total = template_manager.search_templates(query, offset=page * page_size, limit=page_size)
+
+            # テンプレート一覧表示と選択
+            templates_by_id = {t["id"]: t for t in templates}
+            if st.session_state.get("template_selector") not in templates_by_id:
+                # 他のユーザーが削除したテンプレートは選択から外す
+                st.session_state.pop("template_selector", None)
+            if templates:
+                selected_template = st.selectbox(
+                    i18n.get_text("select_template"),
+                    [""] + list(templates_by_id),
+                    format_func=lambda template_id: (
+                        f"{templates_by_id[template_id]['name']} ({templates_by_id[template_id]['created_at']})"
+                        if template_id else ""
+                    ),
+                    key="template_selector"
+                )
+            else:
+                st.caption(i18n.get_text("no_matching_templates"))
+
+            if pages > 1:
+                col_prev, col_page, col_next = st.columns([1, 2, 1])
+                with col_prev:
+                    st.button(i18n.get_text("previous_page"), key="template_prev_page", disabled=page == 0,
+                              on_click=show_template_page, args=(page - 1,))
+                with col_page:
+                    st.caption(i18n.get_text("template_page").format(page=page + 1, pages=pages, total=total))
+                with col_next:
+                    st.button(i18n.get_text("next_page"), key="template_next_page", disabled=page >= pages - 1,
+                              on_click=show_template_page, args=(page + 1,))
 
             if selected_template:
-                template = templates[template_names.index(selected_template) - 1]
+                template = templates_by_id[selected_template]
 
                 # 選択したテンプレートの内容をフォームに表示
                 new_template_name = st.text_input(
@@ -75,7 +185,7 @@ def render_template_manager(i18n):
                             # 削除後にセッション状態をクリア
                             if "template_selector" in st.session_state:
                                 del st.session_state.template_selector
-                            st.rerun()
+                            st.rerun(scope="fragment")
                 with col2:
                     if st.button(i18n.get_text("save_template"), key=f"save_button_{template['id']}"):
                         try:
@@ -89,14 +199,14 @@ def render_template_manager(i18n):
                                 # 更新後にセッション状態をクリア
                                 if "template_selector" in st.session_state:
                                     del st.session_state.template_selector
-                                st.rerun()
+                                st.rerun(scope="fragment")
                             else:
                                 show_notification(i18n.get_text("template_error"), "error")
                         except Exception as e:
                             show_notification(f"{i18n.get_text('template_error')}: {str(e)}", "error")
 
         # テンプレートが存在しない場合または新規作成モードの場合
-        if not templates or not selected_template:
+        if not selected_template:
             new_template_name = st.text_input(
                 i18n.get_text("template_name"),
                 key="new_template_name"
@@ -122,12 +232,61 @@ def render_template_manager(i18n):
                         for key in list(st.session_state.keys()):
                             if key.startswith("new_template_"):
                                 del st.session_state[key]
-                        st.rerun()
+                        st.rerun(scope="fragment")
                     else:
                         show_notification(i18n.get_text("template_error"), "error")
                 except Exception as e:
                     show_notification(f"{i18n.get_text('template_error')}: {str(e)}", "error")
 
+def render_comparison(i18n, messages, models, primary_model):
+    """複数モデルの応答を並べて表示し、完了したものから順に表示を更新する"""
+    placeholders = {}
+    for column, name in zip(st.columns(len(models)), models):
+        with column:
+            st.markdown(f"**{name}**")
+            placeholders[name] = st.empty()
+            placeholders[name].info(i18n.get_text("compare_waiting"))
+
+    def show_result(result):
+        with placeholders[result.model].container():
+            if result.error:
+                st.error(result.error, icon="🚨")
+            else:
+                st.write(result.content)
+            st.caption(f"{result.elapsed:.2f}s")
+
+    results = st.session_state.async_llm_client.compare(messages, models, on_result=show_result)
+
+    # Commit the selected model's answer to the history, or the first one that succeeded
+    answers = {result.model: result.content for result in results if not result.error}
+    if primary_model in answers:
+        return answers[primary_model]
+    return next(iter(answers.values()), None)
+
+def open_search_hit(session_id):
+    """検索結果のボタンから、描画前に履歴セレクタの選択を切り替える"""
+    st.session_state.chat_history_selector = session_id
+
+def render_history_search(i18n, chat_manager):
+    """チャット履歴の全文検索"""
+    with st.expander(i18n.get_text("search_history")):
+        query = st.text_input(i18n.get_text("search_query"), key="history_search_query")
+        if not query:
+            return
+        hits = chat_manager.search(query)
+        if not hits:
+            st.caption(i18n.get_text("search_no_results"))
+        history_ids = set(chat_manager.history_ids())
+        for hit in hits:
+            st.button(
+                f"{chat_manager.history_label(hit.session_id)}: {hit.snippet}",
+                key=f"search_hit_{hit.session_id}_{hit.position}",
+                on_click=open_search_hit,
+                args=(hit.session_id,),
+                # 現在のチャットはまだ履歴セレクタにない
+                disabled=hit.session_id not in history_ids
+            )
+
 def main():
     i18n = st.session_state.i18n
     chat_manager = st.session_state.chat_manager
@@ -156,6 +315,30 @@ def main():
                 show_notification(i18n.get_text("error_test_enabled"), "info")
             else:
                 show_notification(i18n.get_text("error_test_disabled"), "info")
+        bypass_cache = st.checkbox(i18n.get_text("bypass_cache"), key="bypass_cache")
+        if llm_client.cache:
+            cache_stats = llm_client.cache.stats()
+            st.caption(i18n.get_text("cache_stats").format(
+                hits=cache_stats["memory_hits"] + cache_stats["disk_hits"],
+                misses=cache_stats["misses"]
+            ))
+        for routed_model, health in st.session_state.model_router.stats().items():
+            st.caption(i18n.get_text("router_stats").format(
+                model=routed_model,
+                p50=f"{health['p50']:.2f}s" if health["p50"] is not None else "-",
+                p95=f"{health['p95']:.2f}s" if health["p95"] is not None else "-",
+                error_rate=health["error_rate"],
+                circuit=health["circuit"]
+            ))
+        for name, limiter in all_rate_limiters().items():
+            limiter_stats = limiter.stats()
+            st.caption(i18n.get_text("queue_delay_stats").format(
+                name=name,
+                delayed=limiter_stats["delayed_calls"],
+                calls=limiter_stats["calls"],
+                avg=limiter_stats["avg_wait"],
+                max=limiter_stats["max_wait"]
+            ))
 
     # Update language
     if language == "English" and i18n._current_language != "en":
@@ -179,18 +362,21 @@ def main():
     if chat_manager.history:
         selected_chat = st.selectbox(
             i18n.get_text("chat_history"),
-            ["New Chat"] + [f"Chat {session.created_at}" for session in chat_manager.history]
+            ["New Chat"] + chat_manager.history_ids(),
+            format_func=chat_manager.history_label,
+            key="chat_history_selector"
         )
 
-        if selected_chat != "New Chat":
-            chat_id = chat_manager.history[
-                [f"Chat {session.created_at}" for session in chat_manager.history].index(selected_chat)
-            ].id
-            chat_manager.load_chat(chat_id)
+        # Only switch sessions when the selection changes, not on every rerun
+        if selected_chat != st.session_state.get("selected_chat_id"):
+            st.session_state.selected_chat_id = selected_chat
+            if selected_chat != "New Chat":
+                chat_manager.load_chat(selected_chat)
+
+        render_history_search(i18n, chat_manager)
 
     # Display chat messages
-    for message in chat_manager.get_messages(include_system=False):
-        render_message(message["role"], message["content"])
+    render_chat_pane(i18n, chat_manager)
 
     # Chat input
     if prompt := st.chat_input(i18n.get_text("chat_placeholder")):
@@ -200,19 +386,25 @@ def main():
 
         try:
             # Get AI response based on selected model
-            messages = chat_manager.get_messages()
+            messages = chat_manager.get_messages(model=model)
             response = None
+            compare_models = st.session_state.get("compare_models", [])
 
-            # Model selection logic
-            model_map = {
-                "GPT-4": llm_client.chat_openai,
-                "Gemini-2.0": llm_client.chat_gemini,
-                "Claude-3.5": llm_client.chat_claude
-            }
-
-            if model in model_map:
+            if st.session_state.get("compare_mode") and compare_models:
+                response = render_comparison(i18n, messages, compare_models, model)
+            elif model in Config.AVAILABLE_MODELS:
                 try:
-                    response = model_map[model](messages)
+                    # Fails over to the next healthy model if the selected one errors before answering
+                    used_model, stream = st.session_state.model_router.open_stream(
+                        llm_client, messages, model, bypass_cache=bypass_cache
+                    )
+                    if used_model != model:
+                        show_notification(
+                            i18n.get_text("failover_notice").format(preferred=model, model=used_model), "warning"
+                        )
+                    # Render tokens as they arrive; the final text is committed below
+                    response = render_message_stream("assistant", stream)
+                    chat_manager.set_model(used_model)
                 except Exception as e:
                     error_msg = str(e)
                     if "Rate limit exceeded" in error_msg:
@@ -235,17 +427,15 @@ def main():
                 return
 
             if response:
-                # Add AI response
+                # Add AI response (already rendered while streaming)
                 chat_manager.add_message("assistant", response)
-                render_message("assistant", response)
-
-                # Generate and update context summary periodically
-                if len(chat_manager.current_session.messages) % 5 == 0:  # Every 5 messages
-                    try:
-                        summary = llm_client.generate_context_summary(chat_manager.current_session.messages)
-                        chat_manager.update_context_summary(summary)
-                    except Exception as e:
-                        print(f"Failed to generate context summary: {str(e)}")
+                if st.session_state.test_mode and llm_client.last_call:
+                    stats = llm_client.last_call
+                    st.caption(f"TTFT: {stats.ttft or 0:.2f}s / Total: {stats.total_time:.2f}s")
+
+                # Refresh the context summary in the background; later turns pick it up when ready
+                if len(chat_manager.current_session.messages) % Config.SUMMARY_INTERVAL_MESSAGES == 0:
+                    st.session_state.summary_scheduler.schedule(chat_manager, chat_manager.current_session)
 
             # Keep sidebar expanded after chat
             st.session_state.sidebar_state = "expanded"
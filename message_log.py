@@ -0,0 +1,140 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Iterable, Iterator, List, Optional, Union
+from config import Config
+from chat_message import ChatMessage
+
+class MessageLog:
+    """A session's messages with only a hot tail kept in memory.
+
+    Once the tail grows past Config.SESSION_MEMORY_MAX_BYTES, its oldest
+    messages are appended to an anonymous temporary file and read back
+    through a memory map when indexed or iterated. The file is only a cache
+    of what the chat store already holds, so it is unlinked from the start
+    and disappears with the process.
+    """
+
+    # created_at, tokens (-1 when not counted yet), role length, content length
+    _HEADER = struct.Struct("<qiII")
+
+    def __init__(self, messages: Iterable[ChatMessage] = (), max_bytes: int = None):
+        self.max_bytes = max_bytes or Config.SESSION_MEMORY_MAX_BYTES
+        self._offsets = array("Q")  # File offset of every spilled message
+        self._tail: List[ChatMessage] = []
+        self._tail_sizes: List[int] = []  # Measured on append; encoding later grows sys.getsizeof
+        self._tail_bytes = 0
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._size = 0  # Bytes written to the spill file
+        self._lock = threading.Lock()
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._tail)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @property
+    def spilled(self) -> int:
+        """Number of messages that only live in the spill file"""
+        return len(self._offsets)
+
+    def append(self, message: ChatMessage) -> None:
+        with self._lock:
+            size = sys.getsizeof(message.content)
+            self._tail.append(message)
+            self._tail_sizes.append(size)
+            self._tail_bytes += size
+            if self._tail_bytes > self.max_bytes and len(self._tail) > 1:
+                self._spill()
+
+    def _spill(self) -> None:
+        """Move the oldest tail messages to disk until the tail is down to half the cap"""
+        if self._file is None:
+            os.makedirs(Config.SPILL_DIR, exist_ok=True)
+            self._file = tempfile.TemporaryFile(dir=Config.SPILL_DIR)
+
+        count = 0
+        chunks = []
+        while self._tail_bytes > self.max_bytes // 2 and count < len(self._tail) - 1:
+            message = self._tail[count]
+            role = message.role.encode("utf-8")
+            content = message.content.encode("utf-8")
+            tokens = -1 if message.tokens is None else message.tokens
+            self._offsets.append(self._size)
+            chunks.append(self._HEADER.pack(message.created_at, tokens, len(role), len(content)) + role + content)
+            self._size += self._HEADER.size + len(role) + len(content)
+            self._tail_bytes -= self._tail_sizes[count]
+            count += 1
+
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        del self._tail[:count]
+        del self._tail_sizes[:count]
+
+    def _read(self, index: int) -> ChatMessage:
+        offset = self._offsets[index]
+        if self._map is None or offset >= len(self._map):
+            # The file grew since it was last mapped
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        created_at, tokens, role_length, content_length = self._HEADER.unpack_from(self._map, offset)
+        start = offset + self._HEADER.size
+        role = self._map[start:start + role_length].decode("utf-8")
+        content = self._map[start + role_length:start + role_length + content_length].decode("utf-8")
+        return ChatMessage(role, content, created_at, None if tokens < 0 else tokens)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ChatMessage, List[ChatMessage]]:
+        with self._lock:
+            if isinstance(index, slice):
+                return [self._get(i) for i in range(*index.indices(len(self)))]
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("message index out of range")
+            return self._get(index)
+
+    def _get(self, index: int) -> ChatMessage:
+        spilled = len(self._offsets)
+        return self._read(index) if index < spilled else self._tail[index - spilled]
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        # Messages appended while iterating are not included
+        with self._lock:
+            spilled = len(self._offsets)
+            tail = list(self._tail)
+        for index in range(spilled):
+            with self._lock:
+                message = self._read(index)
+            yield message
+        yield from tail
+
+    def close(self) -> None:
+        """Release the spill file; the log is empty afterwards"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            if self._file is not None:
+                self._file.close()
+            self._map = self._file = None
+            self._offsets = array("Q")
+            self._tail = []
+            self._tail_sizes = []
+            self._tail_bytes = self._size = 0
+
+    def __reduce__(self):
+        # Spill files do not survive pickling; rebuild from the messages themselves
+        return MessageLog, (list(self), self.max_bytes)
+
+    def __del__(self):
+        if getattr(self, "_file", None) is not None:
+            self._file.close()
@@ -0,0 +1,177 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+from config import Config
+
+@dataclass
+class CallRecord:
+    """Timings and usage of a single provider call"""
+    provider: str  # "openai" or "openrouter"
+    model: str
+    kind: str = "chat"  # "chat", "stream", "summary" or "compare"
+    queue_wait: float = 0.0  # Seconds spent waiting for the rate limiter
+    connect_time: Optional[float] = None  # Seconds until the response headers arrived
+    ttft: Optional[float] = None  # Seconds until the first token (streaming only)
+    total_time: float = 0.0
+    retries: int = 0
+    prompt_tokens: Optional[int] = None  # From the provider's usage field
+    completion_tokens: Optional[int] = None
+    cache_hit: bool = False
+    chunks: int = 0
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self, label_names: Sequence[str]) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{{{_format_labels(label_names, labels)}}} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.series: Dict[Tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):  # Larger values only count towards +Inf
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names: Sequence[str]) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            base = _format_labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+def _format_labels(names: Sequence[str], values: Tuple) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+class MetricsRegistry:
+    """Process-wide LLM call metrics, exported in Prometheus text format"""
+
+    LABELS = ("provider", "model", "kind")
+
+    def __init__(self):
+        buckets = Config.METRICS_LATENCY_BUCKETS
+        self._lock = threading.Lock()
+        self.requests = Counter("llm_requests_total", "Provider calls by outcome")
+        self.cache_hits = Counter("llm_cache_hits_total", "Calls answered from the response cache")
+        self.retries = Counter("llm_retries_total", "Retried provider requests")
+        self.tokens = Counter("llm_tokens_total", "Tokens reported by the provider usage field")
+        self.latency = Histogram("llm_request_duration_seconds", "Total call latency", buckets)
+        self.ttft = Histogram("llm_time_to_first_token_seconds", "Time to first streamed token", buckets)
+        self.queue_wait = Histogram("llm_queue_wait_seconds", "Time spent waiting for the rate limiter", buckets)
+        self.connect = Histogram("llm_connect_seconds", "Time until response headers arrived", buckets)
+
+    def record(self, call: CallRecord) -> None:
+        labels = (call.provider, call.model, call.kind)
+        with self._lock:
+            self.requests.inc(labels + ("error" if call.error else "ok",))
+            if call.cache_hit:
+                self.cache_hits.inc(labels)
+            if call.retries:
+                self.retries.inc(labels, call.retries)
+            if call.prompt_tokens is not None:
+                self.tokens.inc(labels + ("prompt",), call.prompt_tokens)
+            if call.completion_tokens is not None:
+                self.tokens.inc(labels + ("completion",), call.completion_tokens)
+            self.latency.observe(labels, call.total_time)
+            self.queue_wait.observe(labels, call.queue_wait)
+            if call.ttft is not None:
+                self.ttft.observe(labels, call.ttft)
+            if call.connect_time is not None:
+                self.connect.observe(labels, call.connect_time)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+            lines += self.requests.render(self.LABELS + ("status",))
+            lines += self.cache_hits.render(self.LABELS)
+            lines += self.retries.render(self.LABELS)
+            lines += self.tokens.render(self.LABELS + ("type",))
+            for histogram in (self.latency, self.ttft, self.queue_wait, self.connect):
+                lines += histogram.render(self.LABELS)
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {"ts": round(record.created, 3), "level": record.levelname, "event": record.getMessage()}
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, ensure_ascii=False)
+
+logger = logging.getLogger("mychatme.llm")
+if not logger.handlers:
+    _handler = logging.FileHandler(Config.METRICS_LOG_PATH, encoding="utf-8") if Config.METRICS_LOG_PATH \
+        else logging.StreamHandler()
+    _handler.setFormatter(_JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def record_call(call: CallRecord) -> None:
+    """Add a finished call to the metrics and write it as a structured JSON log line"""
+    registry.record(call)
+    logger.info("llm_call", extra={"fields": asdict(call)})
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port: int = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on localhost once per process; safe to call on every rerun"""
+    global _server
+    with _server_lock:
+        if _server is None and Config.METRICS_ENABLED:
+            try:
+                _server = ThreadingHTTPServer((Config.METRICS_HOST, port or Config.METRICS_PORT), _MetricsHandler)
+            except OSError as e:
+                print(f"Warning: Could not start metrics endpoint: {str(e)}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-endpoint", daemon=True).start()
+        return _server
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque
+from itertools import chain
+from typing import List, Dict, Iterator, Optional, Tuple
+from config import Config
+
+class ModelHealth:
+    """Rolling latency and error statistics plus a circuit breaker for one model"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self):
+        self.latencies = deque(maxlen=Config.ROUTER_LATENCY_WINDOW)
+        self.outcomes = deque(maxlen=Config.ROUTER_LATENCY_WINDOW)  # True for success
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+
+    def _percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self._percentile(0.50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self._percentile(0.95)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def available(self, now: float) -> bool:
+        """Whether allows_request would admit a call now, without claiming the trial"""
+        return self.state == self.CLOSED or now - self.opened_at >= Config.CIRCUIT_COOLDOWN
+
+    def allows_request(self, now: float) -> bool:
+        """Closed circuits always allow; open ones allow one trial request per cooldown.
+
+        Admitting a trial moves the circuit to HALF_OPEN, so only call this for
+        a request that is about to be sent.
+        """
+        if self.state == self.CLOSED:
+            return True
+        if now - self.opened_at >= Config.CIRCUIT_COOLDOWN:
+            self.state = self.HALF_OPEN
+            self.opened_at = now  # Re-arm so concurrent callers do not all become trials
+            return True
+        return False
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self, now: float) -> None:
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        tripped = (
+            self.state == self.HALF_OPEN
+            or self.consecutive_failures >= Config.CIRCUIT_FAILURE_THRESHOLD
+            or (len(self.outcomes) >= Config.CIRCUIT_MIN_SAMPLES
+                and self.error_rate >= Config.CIRCUIT_ERROR_RATE)
+        )
+        if tripped:
+            self.state = self.OPEN
+            self.opened_at = now
+
+class ModelRouter:
+    """Route chat requests to the preferred model, failing over down a priority list.
+
+    One router is shared by every session in the process so health statistics
+    and circuit state reflect all users' calls; the caller's LLMClient (with its
+    test mode and call instrumentation) is passed in per request.
+    """
+
+    def __init__(self, priority: List[str] = None):
+        self.priority = priority or Config.FAILOVER_PRIORITY
+        self.health: Dict[str, ModelHealth] = {model: ModelHealth() for model in Config.AVAILABLE_MODELS}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stream_function(llm_client, model: str):
+        return {
+            "GPT-4": llm_client.stream_openai,
+            "Gemini-2.0": llm_client.stream_gemini,
+            "Claude-3.5": llm_client.stream_claude
+        }[model]
+
+    def candidates(self, preferred: str) -> List[str]:
+        """Models to try in order: the preferred one, then healthy fallbacks by latency.
+
+        Circuits are only inspected here; a model's trial request is claimed by
+        _admit right before that model is actually called.
+        """
+        now = time.monotonic()
+        with self._lock:
+            fallbacks = [m for m in self.priority if m != preferred and m in self.health]
+            # Stable sort keeps the configured priority among models with no latency data yet
+            fallbacks.sort(key=lambda m: self.health[m].p95 or 0.0)
+            ordered = [preferred] + fallbacks
+            return [m for m in ordered if self.health[m].available(now)]
+
+    def _admit(self, model: str) -> bool:
+        with self._lock:
+            return self.health[model].allows_request(time.monotonic())
+
+    def _record(self, model: str, latency: float = None) -> None:
+        with self._lock:
+            if latency is None:
+                self.health[model].record_failure(time.monotonic())
+            else:
+                self.health[model].record_success(latency)
+
+    def _finish(self, model: str, start: float, chunks: Iterator[str]) -> Iterator[str]:
+        """Pass the remaining chunks through and record the outcome once the stream ends"""
+        try:
+            yield from chunks
+        except Exception:
+            self._record(model)
+            raise
+        self._record(model, time.perf_counter() - start)
+
+    def open_stream(self, llm_client, messages: List[Dict[str, str]], preferred: str,
+                    bypass_cache: bool = False) -> Tuple[str, Iterator[str]]:
+        """Start streaming from the first model that produces a token.
+
+        Returns the model that answered and its stream. Failover only happens
+        before the first token; a stream that breaks later raises as usual.
+        """
+        if preferred not in self.health:
+            raise ValueError(f"Invalid model selection: {preferred}")
+
+        # Test mode exists to surface errors, so never hide them behind a fallback
+        test_mode = llm_client.test_mode
+        models = [preferred] if test_mode else self.candidates(preferred)
+        unavailable = Exception("Rate limit exceeded: every model is temporarily unavailable (circuit open)")
+
+        last_error = None
+        for model in models:
+            # Another session may have taken the trial request since candidates() looked
+            if not test_mode and not self._admit(model):
+                continue
+            start = time.perf_counter()
+            try:
+                stream = self._stream_function(llm_client, model)(messages, bypass_cache=bypass_cache)
+                first = next(stream, None)
+            except Exception as e:
+                print(f"Model {model} failed, trying next model: {str(e)}")
+                self._record(model)
+                last_error = e
+                continue
+
+            chunks = iter(()) if first is None else chain([first], stream)
+            return model, self._finish(model, start, chunks)
+
+        raise last_error or unavailable
+
+    def stats(self) -> Dict[str, Dict]:
+        """Rolling latency, error rate and circuit state per model"""
+        with self._lock:
+            return {
+                model: {
+                    "p50": health.p50,
+                    "p95": health.p95,
+                    "error_rate": health.error_rate,
+                    "circuit": health.state
+                }
+                for model, health in self.health.items()
+            }
@@ -1,8 +1,73 @@
 import os
+import json
 import time
+import threading
 import requests
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from typing import List, Dict, Optional, Iterator
 from config import Config
+from rate_limiter import (
+    RateLimitExceeded, get_rate_limiter, backoff_delay, parse_retry_after, parse_rate_limit_reset
+)
+from token_counter import count_messages_tokens
+from metrics import CallRecord
+
+class _BoundedWaitMixin:
+    """Wait at most OPENROUTER_POOL_TIMEOUT for a free connection instead of forever.
+
+    requests never passes pool_timeout to urllib3, so with pool_block a request
+    would otherwise queue indefinitely behind long-running streams.
+    """
+
+    def _get_conn(self, timeout=None):
+        return super()._get_conn(Config.OPENROUTER_POOL_TIMEOUT if timeout is None else timeout)
+
+class _BoundedHTTPConnectionPool(_BoundedWaitMixin, HTTPConnectionPool):
+    pass
+
+class _BoundedHTTPSConnectionPool(_BoundedWaitMixin, HTTPSConnectionPool):
+    pass
+
+class _BoundedPoolAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools raise EmptyPoolError when no connection frees up in time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _BoundedHTTPConnectionPool,
+            "https": _BoundedHTTPSConnectionPool
+        }
+
+_shared_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_session_last_used = 0.0
+
+def get_shared_session() -> requests.Session:
+    """Return the process-wide keep-alive session, dropping connections that sat idle too long"""
+    global _shared_session, _session_last_used
+    with _session_lock:
+        now = time.monotonic()
+        if _shared_session is None:
+            _shared_session = requests.Session()
+            # Retries are handled by OpenRouterClient, so the adapter must not retry on its own.
+            # pool_block keeps the number of connections per host at OPENROUTER_POOL_MAXSIZE;
+            # a request that finds them all busy fails after OPENROUTER_POOL_TIMEOUT.
+            adapter = _BoundedPoolAdapter(
+                pool_connections=Config.OPENROUTER_POOL_CONNECTIONS,
+                pool_maxsize=Config.OPENROUTER_POOL_MAXSIZE,
+                pool_block=True,
+                max_retries=0
+            )
+            _shared_session.mount("https://", adapter)
+            _shared_session.mount("http://", adapter)
+        elif now - _session_last_used > Config.OPENROUTER_POOL_IDLE_TIMEOUT:
+            # The server has most likely closed these sockets already; start from fresh pools
+            for adapter in _shared_session.adapters.values():
+                adapter.close()
+        _session_last_used = now
+        return _shared_session
 
 class OpenRouterClient:
     def __init__(self):
@@ -12,76 +77,119 @@ class OpenRouterClient:
         self.base_url = Config.OPENROUTER_API_BASE
         self.max_retries = 3
         self.retry_delay = 2  # Initial delay in seconds
+        self.temperature = 0.7
+        self.max_tokens = 1000
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://replit.com",
+            "X-Title": "MyChatMe",
+            "Content-Type": "application/json"
+        }
+
+    def _build_payload(self, messages: List[Dict[str, str]], model: str = None,
+                       response_format: Optional[Dict] = None, stream: bool = False) -> Dict:
+        """Build the JSON body for a chat completion request"""
+        data = {
+            "model": model or Config.GEMINI_MODEL,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
 
-    def create(self, messages: List[Dict[str, str]], model: str = None, response_format: Optional[Dict] = None) -> str:
+        if response_format:
+            data["response_format"] = response_format
+        if stream:
+            data["stream"] = True
+            # Ask for token usage in the final streamed event
+            data["usage"] = {"include": True}
+
+        return data
+
+    def _rate_limit_delay(self, response: requests.Response, error_data: Dict, retries: int) -> float:
+        """Seconds to wait after a 429, from Retry-After, provider metadata or backoff"""
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            # Provider-specific limits carry the upstream rate limit headers in the error metadata
+            metadata = error_data.get("error", {}).get("metadata") or {}
+            provider_headers = metadata.get("headers") or {}
+            delay = parse_retry_after(provider_headers.get("Retry-After"))
+            if delay is None:
+                delay = parse_rate_limit_reset(
+                    provider_headers.get("X-RateLimit-Reset") or response.headers.get("X-RateLimit-Reset")
+                )
+        if delay is None:
+            delay = backoff_delay(self.retry_delay, retries)
+        return delay
+
+    def _post(self, data: Dict, stream: bool = False, record: Optional[CallRecord] = None) -> requests.Response:
+        """POST a chat completion request, pacing it through the rate limiter and retrying failures"""
         if not self.api_key:
             raise ValueError("OpenRouter API key is not set")
 
+        limiter = get_rate_limiter("openrouter", data["model"])
+        request_tokens = count_messages_tokens(data["messages"]) + data.get("max_tokens", 0)
         retries = 0
         last_error = None
 
         while retries < self.max_retries:
             try:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "HTTP-Referer": "https://replit.com",
-                    "X-Title": "MyChatMe",
-                    "Content-Type": "application/json"
-                }
-
-                data = {
-                    "model": model or Config.GEMINI_MODEL,
-                    "messages": messages,
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                }
-
-                if response_format:
-                    data["response_format"] = response_format
-
-                response = requests.post(
+                # Waits for capacity before sending; Retry-After from earlier 429s is honored here
+                queue_wait = limiter.acquire(request_tokens)
+                if record:
+                    record.queue_wait += queue_wait
+                    record.retries = retries
+
+                response = get_shared_session().post(
                     f"{self.base_url}/chat/completions",
-                    headers=headers,
+                    headers=self.headers,
                     json=data,
-                    timeout=30  # Added timeout
+                    timeout=Config.OPENROUTER_REQUEST_TIMEOUT,
+                    stream=stream
                 )
 
                 if response.status_code == 429:
-                    error_data = response.json()
+                    try:
+                        error_data = response.json()
+                    except ValueError:
+                        error_data = {}
                     error_message = error_data.get('error', {}).get('message', 'Rate limit exceeded')
                     print(f"Rate limit error: {error_message}")
 
-                    # Check if it's a provider-specific rate limit
-                    if 'metadata' in error_data.get('error', {}):
-                        provider = error_data['error']['metadata'].get('provider_name', 'Unknown')
-                        raise Exception(f"Rate limit exceeded for provider: {provider}")
+                    wait_time = self._rate_limit_delay(response, error_data, retries)
+                    limiter.block_for(wait_time)
+                    if wait_time > Config.RATE_LIMIT_MAX_WAIT:
+                        # Check if it's a provider-specific rate limit
+                        metadata = error_data.get('error', {}).get('metadata') or {}
+                        if metadata:
+                            provider = metadata.get('provider_name', 'Unknown')
+                            raise RateLimitExceeded(f"Rate limit exceeded for provider: {provider}")
+                        raise RateLimitExceeded(f"Rate limit exceeded: retry after {wait_time:.0f} seconds")
 
-                    wait_time = self.retry_delay * (2 ** retries)
-                    print(f"Rate limit exceeded. Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
+                    print(f"Rate limit exceeded. Retrying in {wait_time:.1f} seconds...")
+                    last_error = RateLimitExceeded(error_message)
                     retries += 1
                     continue
 
                 response.raise_for_status()
-                response_data = response.json()
-
-                if "error" in response_data:
-                    raise ValueError(f"OpenRouter API returned error: {response_data['error']}")
-
-                if not response_data.get('choices'):
-                    raise ValueError("No choices in OpenRouter API response")
-
-                if not response_data['choices'][0].get('message'):
-                    raise ValueError("No message in OpenRouter API response choice")
-
-                return response_data['choices'][0]['message']['content']
+                if record:
+                    # Time from sending the request until the response headers were parsed
+                    record.connect_time = response.elapsed.total_seconds()
+                return response
 
+            except EmptyPoolError:
+                # Every connection is busy; waiting again would only hold the worker longer
+                print("OpenRouter Request Error: no free connection in the pool")
+                last_error = RateLimitExceeded(
+                    f"Rate limit exceeded: no free connection within {Config.OPENROUTER_POOL_TIMEOUT} seconds"
+                )
+                break
             except requests.exceptions.RequestException as e:
                 print(f"OpenRouter Request Error: {str(e)}")
                 last_error = e
                 retries += 1
                 if retries < self.max_retries:
-                    time.sleep(self.retry_delay * (2 ** retries))
+                    # The request thread sleeps here, so never longer than a queued request may wait
+                    time.sleep(backoff_delay(self.retry_delay, retries, cap=Config.RATE_LIMIT_MAX_WAIT))
             except ValueError as e:
                 print(f"OpenRouter Value Error: {str(e)}")
                 last_error = e
@@ -94,5 +202,72 @@ class OpenRouterClient:
         # If all retries failed or other error occurred
         error_msg = str(last_error) if last_error else "Maximum retries exceeded"
         if "Rate limit exceeded" in error_msg:
-            raise Exception(f"OpenRouter rate limit exceeded. Please try again later or switch to a different model.")
-        raise Exception(f"OpenRouter API error: {error_msg}")
\ No newline at end of file
+            raise Exception(f"OpenRouter rate limit exceeded ({error_msg}). Please try again later or switch to a different model.")
+        raise Exception(f"OpenRouter API error: {error_msg}")
+
+    def create(self, messages: List[Dict[str, str]], model: str = None, response_format: Optional[Dict] = None,
+               record: Optional[CallRecord] = None) -> str:
+        response = self._post(self._build_payload(messages, model, response_format), record=record)
+
+        try:
+            response_data = response.json()
+
+            if "error" in response_data:
+                raise ValueError(f"OpenRouter API returned error: {response_data['error']}")
+
+            if not response_data.get('choices'):
+                raise ValueError("No choices in OpenRouter API response")
+
+            if not response_data['choices'][0].get('message'):
+                raise ValueError("No message in OpenRouter API response choice")
+
+            if record:
+                self._record_usage(record, response_data.get("usage"))
+
+            return response_data['choices'][0]['message']['content']
+        except ValueError as e:
+            print(f"OpenRouter Value Error: {str(e)}")
+            raise Exception(f"OpenRouter API error: {str(e)}")
+
+    @staticmethod
+    def _record_usage(record: CallRecord, usage: Optional[Dict]) -> None:
+        if usage:
+            record.prompt_tokens = usage.get("prompt_tokens")
+            record.completion_tokens = usage.get("completion_tokens")
+
+    def stream(self, messages: List[Dict[str, str]], model: str = None, response_format: Optional[Dict] = None,
+               record: Optional[CallRecord] = None) -> Iterator[str]:
+        """Stream a chat completion over Server-Sent Events, yielding content deltas as they arrive"""
+        response = self._post(
+            self._build_payload(messages, model, response_format, stream=True), stream=True, record=record
+        )
+        # SSE bodies are UTF-8 but OpenRouter does not always send a charset
+        response.encoding = "utf-8"
+
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; lines starting with ":" are keep-alive comments
+                if not line or line.startswith(":") or not line.startswith("data:"):
+                    continue
+
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+
+                try:
+                    chunk = json.loads(payload)
+                except json.JSONDecodeError:
+                    print(f"OpenRouter Stream Error: could not decode event: {payload[:200]}")
+                    continue
+
+                if "error" in chunk:
+                    raise Exception(f"OpenRouter API error: {chunk['error']}")
+
+                if record:
+                    self._record_usage(record, chunk.get("usage"))
+
+                choices = chunk.get("choices") or []
+                if choices:
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
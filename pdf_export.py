@@ -0,0 +1,103 @@
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import Config
+
+@dataclass
+class PdfDocument:
+    """Everything needed to render a chat session, with timestamps already formatted.
+
+    Long sessions pass their messages as messages_file, a JSON-lines spool of
+    (role, timestamp, content) that the renderer reads one line at a time, so
+    neither the app nor the worker holds the whole session and only the path
+    is pickled to the worker.
+    """
+    filename: str
+    title: str
+    model: str
+    system_prompt: str = ""
+    context_summary: Optional[str] = None
+    messages: List[Tuple[str, str, str]] = None  # (role, formatted timestamp, content)
+    messages_file: Optional[str] = None
+
+    def iter_messages(self) -> Iterator[Tuple[str, str, str]]:
+        yield from self.messages or []
+        if self.messages_file:
+            with open(self.messages_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    role, timestamp, content = json.loads(line)
+                    yield role, timestamp, content
+
+    def discard_messages_file(self) -> None:
+        """Remove the spool once rendering finished or was cancelled"""
+        if self.messages_file and os.path.exists(self.messages_file):
+            os.remove(self.messages_file)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    """One pool per process, started on the first export"""
+    global _executor
+    # reportlab is only imported once somebody exports a PDF
+    from pdf_render import get_pdf_styles
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers do not inherit the server's threads or open sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.PDF_EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_pdf_styles
+            )
+        return _executor
+
+@dataclass
+class PdfExportJob:
+    id: str
+    label: str  # Shown in the UI; the document title by default
+    future: Future
+
+    @property
+    def status(self) -> str:
+        """"queued", "running", "done" or "failed" """
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        return "failed" if self.future.exception() else "done"
+
+    @property
+    def filename(self) -> Optional[str]:
+        return self.future.result() if self.status == "done" else None
+
+    @property
+    def error(self) -> Optional[str]:
+        return str(self.future.exception()) if self.status == "failed" else None
+
+class PdfExportQueue:
+    """A user's PDF export jobs, rendered in the shared process pool"""
+
+    def __init__(self):
+        self.jobs: Dict[str, PdfExportJob] = {}
+
+    def submit(self, document: PdfDocument, label: str = "") -> PdfExportJob:
+        from pdf_render import render_pdf
+        job = PdfExportJob(
+            id=uuid.uuid4().hex[:8],
+            label=label or document.title,
+            future=_get_executor().submit(render_pdf, document)
+        )
+        job.future.add_done_callback(lambda _: document.discard_messages_file())
+        self.jobs[job.id] = job
+        return job
+
+    def pending(self) -> bool:
+        return any(not job.future.done() for job in self.jobs.values())
+
+    def discard(self, job_id: str) -> None:
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            job.future.cancel()
@@ -0,0 +1,161 @@
+"""Rendering of PdfDocument with reportlab; imported on the first PDF export"""
+import os
+import re
+import threading
+import zlib
+from itertools import islice
+from typing import Iterator, Optional
+from xml.sax.saxutils import escape
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Flowable
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle, StyleSheet1
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFName, PDFStream
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from config import Config
+from pdf_export import PdfDocument
+
+_styles: Optional[StyleSheet1] = None
+_styles_lock = threading.Lock()
+
+def get_pdf_styles() -> StyleSheet1:
+    """Register the Japanese CID fonts and build the stylesheet once per process"""
+    global _styles
+    with _styles_lock:
+        if _styles is None:
+            try:
+                # Register the Japanese font
+                pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
+                pdfmetrics.registerFont(UnicodeCIDFont('HeiseiKakuGo-W5'))
+            except Exception as e:
+                print(f"Warning: Could not register PDF fonts: {str(e)}")
+
+            styles = getSampleStyleSheet()
+            # Create custom styles with Japanese font support
+            styles.add(ParagraphStyle(
+                name='JapaneseText',
+                parent=styles['Normal'],
+                fontName='HeiseiMin-W3',
+                fontSize=10,
+                leading=14
+            ))
+            styles.add(ParagraphStyle(
+                name='JapaneseHeading',
+                parent=styles['Heading1'],
+                fontName='HeiseiKakuGo-W5',
+                fontSize=16,
+                leading=20
+            ))
+            _styles = styles
+        return _styles
+
+def split_text(text: str, limit: int) -> Iterator[str]:
+    """Split text into blocks of at most limit characters at paragraph, then line boundaries"""
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip("\n")
+        if not paragraph:
+            continue
+        block = []
+        size = 0
+        for line in paragraph.split("\n"):
+            # A single line longer than the limit is cut into pieces
+            for piece in [line[i:i + limit] for i in range(0, len(line), limit)] or [""]:
+                if block and size + len(piece) + 1 > limit:
+                    yield "\n".join(block)
+                    block, size = [], 0
+                block.append(piece)
+                size += len(piece) + 1
+        if block:
+            yield "\n".join(block)
+
+def to_markup(text: str) -> str:
+    """Escape text for Paragraph's XML markup, keeping line breaks and indentation"""
+    markup = re.sub(r"(?m)^ +", lambda match: "&nbsp;" * len(match.group()), escape(text))
+    return markup.replace("\n", "<br/>")
+
+def _story(document: PdfDocument, styles: StyleSheet1) -> Iterator[Flowable]:
+    heading = styles['JapaneseHeading']
+    text = styles['JapaneseText']
+    limit = Config.PDF_MAX_PARAGRAPH_CHARS
+
+    yield Paragraph(to_markup(document.title), heading)
+    yield Paragraph(to_markup(f"Model: {document.model}"), text)
+    yield Spacer(1, 12)
+
+    # Add system prompt if exists
+    if document.system_prompt:
+        yield Paragraph("System Prompt", heading)
+        for block in split_text(document.system_prompt, limit):
+            yield Paragraph(to_markup(block), text)
+        yield Spacer(1, 12)
+
+    # Add context summary if exists
+    if document.context_summary:
+        yield Paragraph("Context Summary", heading)
+        for block in split_text(document.context_summary, limit):
+            yield Paragraph(to_markup(block), text)
+        yield Spacer(1, 12)
+
+    yield Paragraph("Messages", heading)
+    for role, timestamp, content in document.iter_messages():
+        yield Paragraph(to_markup(f"{role} ({timestamp})"), heading)
+        # Long messages become many small paragraphs that can flow across pages
+        for block in split_text(content, limit):
+            yield Paragraph(to_markup(block), text)
+        yield Spacer(1, 12)
+
+class _LazyStory(list):
+    """A story list that is refilled from a generator as the document consumes it.
+
+    doc.build only ever looks at, removes and re-inserts flowables at the
+    front, so holding a short buffer keeps just a page or two of flowables
+    alive instead of the whole session.
+    """
+
+    def __init__(self, flowables: Iterator[Flowable], buffer_size: int):
+        super().__init__()
+        self._source = flowables
+        self._buffer_size = buffer_size
+        self._refill()
+
+    def _refill(self) -> None:
+        if self._source is not None and len(self) < self._buffer_size // 2:
+            self.extend(islice(self._source, self._buffer_size - len(self)))
+            if len(self) < self._buffer_size:
+                self._source = None  # Exhausted
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._refill()
+
+class _CompressingCanvas(Canvas):
+    """Compress each page's content stream as soon as the page is finished.
+
+    reportlab otherwise keeps every page stream as uncompressed text until
+    the file is saved, which is most of the memory a long export uses.
+    """
+
+    def showPage(self):
+        super().showPage()
+        page = self._doc.Pages.pages[-1]
+        # A stream whose dictionary already names its filter is written out as is
+        contents = PDFStream(content=zlib.compress(page.stream.encode("utf8")))
+        contents.dictionary["Filter"] = PDFArray([PDFName("FlateDecode")])
+        page.Contents = contents
+        page.stream = None
+
+def render_pdf(document: PdfDocument) -> str:
+    """Render a chat session to PDF and return the filename.
+
+    Flowables are generated lazily, long messages are split into many
+    paragraphs and finished pages are compressed right away, so memory use
+    grows only by the compressed page streams reportlab keeps until the file
+    is written.
+    """
+    styles = get_pdf_styles()
+    if os.path.dirname(document.filename):
+        os.makedirs(os.path.dirname(document.filename), exist_ok=True)
+    doc = SimpleDocTemplate(document.filename, pagesize=A4)
+    doc.build(_LazyStory(_story(document, styles), Config.PDF_STORY_BUFFER), canvasmaker=_CompressingCanvas)
+    return document.filename
@@ -1,13 +1,57 @@
 import json
 import os
-from typing import Dict, List
+from bisect import bisect_left, insort
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from config import Config
+from chat_search import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+    """変更検知用の (inode, mtime, サイズ)。ファイルがなければ None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
 
 class PromptTemplateManager:
-    def __init__(self):
-        self.templates_dir = "templates"
+    """プロセス全体で共有されるテンプレートストア
+
+    templates.json はある時点のスナップショットで、それ以降の変更は
+    templates.journal に1行ずつ追記される。書き込みの手間は変更した
+    テンプレート1件分だけで、ジャーナルが長くなったらスナップショットに
+    まとめ直す（コンパクション）。複数のワーカープロセスの間は flock で、
+    同じプロセスのスレッド間はロックで排他し、他のプロセスの変更は
+    ファイルの mtime とサイズの変化で検知して読み込む。
+
+    名前（正規化済み）・作成日時・ID の順に並べた索引を変更のたびに
+    更新しておき、検索と一覧はそこから1ページ分だけを取り出す。
+    """
+
+    def __init__(self, templates_dir: str = None):
+        self.templates_dir = templates_dir or Config.TEMPLATE_DIR
         self.ensure_template_directory()
+        self.template_file = os.path.join(self.templates_dir, "templates.json")
+        self.journal_file = os.path.join(self.templates_dir, "templates.journal")
+        self.lock_file = os.path.join(self.templates_dir, ".templates.lock")
         self._templates: Dict[str, Dict] = {}
+        self._index: List[Tuple[str, str, str]] = []  # (正規化した名前, 作成日時, ID) の昇順
+        self._index_keys: Dict[str, Tuple[str, str, str]] = {}  # ID -> 索引のキー
+        # 複数のブラウザセッションのスクリプトスレッドから同時に呼ばれる
+        self._lock = threading.RLock()
+        self._snapshot_stat = None  # 読み込んだスナップショットの _stat
+        self._journal_stat = None  # 最後に読んだ時点のジャーナルの _stat
+        self._journal_offset = 0  # ジャーナルの適用済みバイト数
+        self._journal_entries = 0  # 前回のコンパクション以降のエントリ数
         self.load_templates()
 
     def ensure_template_directory(self):
@@ -15,58 +59,228 @@ class PromptTemplateManager:
         if not os.path.exists(self.templates_dir):
             os.makedirs(self.templates_dir)
 
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """他のプロセスとの排他（読み込みは共有ロック、書き込みは排他ロック）"""
+        with open(self.lock_file, "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield  # ファイルを閉じるとロックも解放される
+
     def load_templates(self):
         """保存されているテンプレートを読み込む"""
-        template_file = os.path.join(self.templates_dir, "templates.json")
-        if os.path.exists(template_file):
+        with self._lock, self._file_lock(exclusive=False):
+            self._load()
+
+    def _load(self):
+        """スナップショットを読み直し、ジャーナルを最初から適用する（ファイルロック内で呼ぶ）"""
+        self._templates = {}
+        self._snapshot_stat = _stat(self.template_file)
+        if self._snapshot_stat is not None:
             try:
-                with open(template_file, "r", encoding="utf-8") as f:
+                with open(self.template_file, "r", encoding="utf-8") as f:
                     self._templates = json.load(f)
             except Exception as e:
                 print(f"テンプレート読み込みエラー: {str(e)}")
                 self._templates = {}
+        self._index_keys = {template_id: self._index_key(template_id, template)
+                            for template_id, template in self._templates.items()}
+        self._index = sorted(self._index_keys.values())
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._replay()
 
-    def save_templates(self):
-        """テンプレートをファイルに保存"""
-        template_file = os.path.join(self.templates_dir, "templates.json")
+    def _replay(self):
+        """ジャーナルのうち未適用の部分を適用する（ファイルロック内で呼ぶ）"""
+        self._journal_stat = _stat(self.journal_file)
+        if self._journal_stat is None:
+            return
+        with open(self.journal_file, "rb") as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+        # 書き込み途中で止まった最後の行は、改行が付くまで読み飛ばす
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                print(f"テンプレートジャーナル読み込みエラー: {str(e)}")
+                continue
+            self._journal_entries += 1
+        self._journal_offset += end
+
+    @staticmethod
+    def _index_key(template_id: str, template: Dict) -> Tuple[str, str, str]:
+        return normalize(template.get("name", "")), template.get("created_at", ""), template_id
+
+    def _apply(self, entry: Dict):
+        template_id = entry["id"]
+        if entry["op"] == "put":
+            self._unindex(template_id)
+            self._templates[template_id] = entry["template"]
+            key = self._index_keys[template_id] = self._index_key(template_id, entry["template"])
+            insort(self._index, key)
+        elif entry["op"] == "delete":
+            self._unindex(template_id)
+            self._templates.pop(template_id, None)
+
+    def _unindex(self, template_id: str):
+        key = self._index_keys.pop(template_id, None)
+        if key is not None:
+            del self._index[bisect_left(self._index, key)]
+
+    def _changed(self) -> bool:
+        return (_stat(self.template_file) != self._snapshot_stat
+                or _stat(self.journal_file) != self._journal_stat)
+
+    def _sync(self):
+        """他のプロセスによる変更を取り込む（ファイルロック内で呼ぶ）"""
+        journal = _stat(self.journal_file)
+        if (_stat(self.template_file) != self._snapshot_stat
+                or (journal is not None and journal[2] < self._journal_offset)
+                or (journal is None and self._journal_offset)):
+            # コンパクションされたか、ファイルが手で置き換えられた
+            self._load()
+        elif journal != self._journal_stat:
+            self._replay()
+
+    def _refresh(self):
+        """読み取りの前に呼ぶ。ファイルが変わっていなければ stat 2回で済む"""
+        if self._changed():
+            with self._file_lock(exclusive=False):
+                self._sync()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """最新の状態を取り込んだうえで、他のスレッドとプロセスを締め出す"""
+        with self._lock, self._file_lock(exclusive=True):
+            self._sync()
+            yield
+
+    def _append(self, entry: Dict):
+        """変更を1行としてジャーナルに追記して適用する（_writing の中で呼ぶ）"""
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
         try:
-            with open(template_file, "w", encoding="utf-8") as f:
+            if self._journal_stat is not None and self._journal_stat[2] > self._journal_offset:
+                # 排他ロック中に残っている改行のない末尾は、途中で落ちた書き込みの残骸
+                os.truncate(self.journal_file, self._journal_offset)
+            fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            raise Exception(f"テンプレート保存エラー: {str(e)}")
+        self._apply(entry)
+        self._journal_entries += 1
+        self._journal_offset += len(line)
+        self._journal_stat = _stat(self.journal_file)
+        if self._journal_entries >= Config.TEMPLATE_JOURNAL_COMPACT_ENTRIES:
+            self._compact()
+
+    def _compact(self):
+        """全テンプレートをスナップショットに書き出してジャーナルを空にする（_writing の中で呼ぶ）"""
+        # 同じディレクトリの一時ファイルに書いてから置き換えるので、読み手が書きかけを見ることはない
+        fd, tmp_path = tempfile.mkstemp(dir=self.templates_dir, prefix=".templates.", suffix=".tmp")
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
                 json.dump(self._templates, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)  # mkstemp creates the file readable by the owner only
+            os.replace(tmp_path, self.template_file)
+            # ここで落ちてもジャーナルの再適用は同じ結果になる
+            with open(self.journal_file, "w"):
+                pass
         except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             raise Exception(f"テンプレート保存エラー: {str(e)}")
+        self._snapshot_stat = _stat(self.template_file)
+        self._journal_stat = _stat(self.journal_file)
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def save_templates(self):
+        """テンプレートをファイルに保存（スナップショットを書き直してジャーナルを空にする）"""
+        with self._writing():
+            self._compact()
 
     def add_template(self, name: str, content: str, description: str = "") -> bool:
         """新しいテンプレートを追加"""
         if not name or not content:
             return False
 
-        template_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self._templates[template_id] = {
-            "name": name,
-            "content": content,
-            "description": description,
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self.save_templates()
+        now = datetime.now()
+        # 同じ秒に追加されても衝突しないように乱数の接尾辞を付ける
+        template_id = f"{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        with self._writing():
+            self._append({"op": "put", "id": template_id, "template": {
+                "name": name,
+                "content": content,
+                "description": description,
+                "created_at": now.strftime("%Y-%m-%d %H:%M:%S")
+            }})
         return True
 
     def get_template(self, template_id: str) -> Dict:
         """指定されたIDのテンプレートを取得"""
-        return self._templates.get(template_id, {})
+        with self._lock:
+            self._refresh()
+            return dict(self._templates.get(template_id, {}))
 
     def list_templates(self) -> List[Dict]:
         """全てのテンプレートをリスト形式で取得"""
-        return [
-            {"id": k, **v}
-            for k, v in self._templates.items()
-        ]
+        with self._lock:
+            self._refresh()
+            return [
+                {"id": k, **v}
+                for k, v in self._templates.items()
+            ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._templates)
+
+    def search_templates(
+        self,
+        query: str = "",
+        offset: int = 0,
+        limit: int | None = None,
+        prefix_only: bool = False
+    ) -> Tuple[List[Dict], int]:
+        """名前で検索したテンプレートの1ページ分と、一致した総数を返す
+
+        空の検索語は全件を名前順に返す。それ以外は前方一致を名前順に並べ、
+        prefix_only でなければその後に名前の途中で一致したものを続ける。
+        大文字小文字や全角半角は区別しない。
+        """
+        query = normalize(query.strip())
+        with self._lock:
+            self._refresh()
+            if not query:
+                matches = self._index
+            else:
+                # 前方一致は二分探索で範囲を求めるだけで済む
+                start = bisect_left(self._index, (query,))
+                end = bisect_left(self._index, (query + "\U0010ffff",))
+                matches = self._index[start:end]
+                if not prefix_only:
+                    matches += [key for key in self._index[:start] if query in key[0]]
+                    matches += [key for key in self._index[end:] if query in key[0]]
+            page = matches[offset:] if limit is None else matches[offset:offset + limit]
+            return [{"id": key[2], **self._templates[key[2]]} for key in page], len(matches)
 
     def delete_template(self, template_id: str) -> bool:
         """テンプレートを削除"""
-        if template_id in self._templates:
-            del self._templates[template_id]
-            self.save_templates()
-            return True
+        with self._writing():
+            if template_id in self._templates:
+                self._append({"op": "delete", "id": template_id})
+                return True
         return False
 
     def update_template(
@@ -77,16 +291,17 @@ class PromptTemplateManager:
         description: str | None = None
     ) -> bool:
         """テンプレートを更新"""
-        if template_id not in self._templates:
-            return False
+        with self._writing():
+            if template_id not in self._templates:
+                return False
 
-        template = self._templates[template_id]
-        if name is not None:
-            template["name"] = name
-        if content is not None:
-            template["content"] = content
-        if description is not None:
-            template["description"] = description
+            template = dict(self._templates[template_id])
+            if name is not None:
+                template["name"] = name
+            if content is not None:
+                template["content"] = content
+            if description is not None:
+                template["description"] = description
 
-        self.save_templates()
-        return True
\ No newline at end of file
+            self._append({"op": "put", "id": template_id, "template": template})
+        return True
@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from config import Config
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to wait longer than Config.RATE_LIMIT_MAX_WAIT"""
+
+class TokenBucket:
+    """Bucket refilled continuously at `per_minute` units per minute.
+
+    Consumption may drive the level below zero; the deficit is the queue of
+    callers that already reserved capacity and are sleeping until it refills.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)  # A single oversized request must still be able to run
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+class RateLimiter:
+    """Paces calls to one provider/model in requests per minute and tokens per minute"""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.calls = 0
+        self.delayed_calls = 0
+
+    def acquire(self, tokens: int = 0, max_wait: float = None) -> float:
+        """Reserve capacity for one request, sleeping until it is available.
+
+        Returns the queueing delay in seconds. Raises RateLimitExceeded instead
+        of waiting when the delay would exceed max_wait, so the request thread
+        is never held longer than that (jitter included).
+        """
+        max_wait = Config.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            wait = max(self._blocked_until - now, self.requests.wait_time(1))
+            if self.tokens:
+                self.tokens.refill(now)
+                wait = max(wait, self.tokens.wait_time(tokens))
+            if wait > max_wait:
+                raise RateLimitExceeded(
+                    f"Rate limit exceeded for {self.name}: next slot in {wait:.0f} seconds"
+                )
+
+            self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(tokens)
+            if wait > 0:
+                # Spread out callers that were released by the same refill or Retry-After,
+                # without ever sleeping past max_wait
+                wait = min(wait + random.uniform(0, Config.RATE_LIMIT_JITTER), max_wait)
+                self.delayed_calls += 1
+            self.calls += 1
+            self.total_wait += wait
+            self.max_wait_seen = max(self.max_wait_seen, wait)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def block_for(self, seconds: float) -> None:
+        """Hold back every caller for the given time, e.g. after a 429 with Retry-After"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, float]:
+        """Queueing delay observed by callers of this limiter"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "delayed_calls": self.delayed_calls,
+                "total_wait": self.total_wait,
+                "avg_wait": self.total_wait / self.calls if self.calls else 0.0,
+                "max_wait": self.max_wait_seen
+            }
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """Process-wide limiter for a provider and model; model limits override provider limits"""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = Config.RATE_LIMITS.get(model) or Config.RATE_LIMITS[provider]
+            limiter = RateLimiter(
+                f"{provider}/{model}",
+                limits["requests_per_minute"],
+                limits.get("tokens_per_minute")
+            )
+            _limiters[key] = limiter
+        return limiter
+
+def all_rate_limiters() -> Dict[str, RateLimiter]:
+    with _limiters_lock:
+        return {limiter.name: limiter for limiter in _limiters.values()}
+
+def backoff_delay(base: float, attempt: int, cap: float = None) -> float:
+    """Exponential backoff with full jitter"""
+    cap = Config.RETRY_MAX_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def parse_rate_limit_reset(value) -> Optional[float]:
+    """Seconds until an X-RateLimit-Reset epoch timestamp (seconds or milliseconds)"""
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    if reset > 1e11:  # Milliseconds
+        reset /= 1000.0
+    return max(0.0, reset - time.time())
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from config import Config
+
+class ResponseCache:
+    """Two-tier cache of completed responses: an in-process LRU in front of SQLite"""
+
+    def __init__(
+        self,
+        db_path: str = None,
+        ttl: float = None,
+        max_memory_entries: int = None,
+        max_disk_entries: int = None
+    ):
+        self.db_path = db_path or Config.RESPONSE_CACHE_PATH
+        self.ttl = ttl if ttl is not None else Config.RESPONSE_CACHE_TTL
+        self.max_memory_entries = max_memory_entries or Config.RESPONSE_CACHE_MEMORY_ENTRIES
+        self.max_disk_entries = max_disk_entries or Config.RESPONSE_CACHE_DISK_ENTRIES
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, response)
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._db = None
+
+        try:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses(accessed_at)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            # The memory tier still works without the disk tier
+            print(f"Warning: Could not open response cache database: {str(e)}")
+            self._db = None
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict] = None
+    ) -> str:
+        """Stable hash of everything that determines a provider's answer"""
+        # Only role and content reach the model's output; timestamps would defeat the cache
+        payload = {
+            "model": model,
+            "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_format": response_format
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits["memory"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        if not self._expired(row[1], now):
+                            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                            self._db.commit()
+                            self._remember(key, row[1], row[0])
+                            self.hits["disk"] += 1
+                            return row[0]
+                        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Response cache read error: {str(e)}")
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: str) -> None:
+        """Store a response in both tiers"""
+        if not response:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, response, now, now)
+                )
+                self._db.commit()
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= Config.RESPONSE_CACHE_EVICT_EVERY:
+                    self._evict_disk(now)
+            except sqlite3.Error as e:
+                print(f"Response cache write error: {str(e)}")
+
+    def _remember(self, key: str, created_at: float, response: str) -> None:
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        """Drop expired rows and everything beyond the newest max_disk_entries"""
+        self._writes_since_evict = 0
+        if self.ttl:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+        self._db.commit()
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters since this cache was created"""
+        return {
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "memory_entries": len(self._memory)
+        }
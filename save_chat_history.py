@@ -1,8 +1,8 @@
 from chat_manager import ChatManager
 from datetime import datetime
 
-def save_chat_history():
-    chat_manager = ChatManager()
+def save_chat_history(owner: str):
+    chat_manager = ChatManager(owner)
     filename = f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
     
     try:
@@ -0,0 +1,96 @@
+import zlib
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import Config
+from chat_search import tokenize
+
+@lru_cache(maxsize=65536)
+def _feature_hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8"))
+
+class HashedNgramVectorizer:
+    """Deterministic bag-of-n-grams embedding using the hashing trick.
+
+    Terms are the search tokens (words, CJK bigrams) plus character trigrams
+    of Latin words, so inflected forms still overlap. crc32 keeps vectors
+    stable across processes, unlike the salted built-in hash.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or Config.MEMORY_VECTOR_DIM
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        features = []
+        for term in tokenize(text):
+            features.append(term)
+            if len(term) > 3 and term.isascii():
+                padded = f"<{term}>"
+                features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def transform(self, text: str) -> np.ndarray:
+        """L2-normalized float32 vector; all zeros for text without any terms"""
+        weights: Dict[int, float] = {}
+        for feature in self._features(text):
+            hashed = _feature_hash(feature)
+            index = hashed % self.dim
+            # The top bit picks the sign so colliding features tend to cancel out
+            weights[index] = weights.get(index, 0.0) + (1.0 if hashed & 0x80000000 else -1.0)
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if weights:
+            vector[list(weights)] = list(weights.values())
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+class SemanticMemory:
+    """Vectors of a session's messages that have left the context window.
+
+    Rows live in one matrix that doubles when full, so a lookup is a single
+    matrix-vector product over every stored message. The matrix is allocated
+    on the first add, so sessions that never recall anything cost nothing.
+    Only the messages' positions in the session are kept, not the messages.
+    """
+
+    def __init__(self, vectorizer: HashedNgramVectorizer = None):
+        self.vectorizer = vectorizer or HashedNgramVectorizer()
+        self._matrix: Optional[np.ndarray] = None
+        self._positions = array("q")
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(self, position: int, text: str) -> None:
+        if self._matrix is None:
+            self._matrix = np.zeros((64, self.vectorizer.dim), dtype=np.float32)
+        elif len(self._positions) == len(self._matrix):
+            grown = np.zeros((len(self._matrix) * 2, self.vectorizer.dim), dtype=np.float32)
+            grown[:len(self._matrix)] = self._matrix
+            self._matrix = grown
+        self._matrix[len(self._positions)] = self.vectorizer.transform(text)
+        self._positions.append(position)
+
+    def search(self, query: str, top_k: int = None, min_score: float = None) -> List[Tuple[int, float]]:
+        """Positions of the most similar stored messages by cosine similarity, oldest first"""
+        top_k = top_k or Config.MEMORY_TOP_K
+        min_score = Config.MEMORY_MIN_SIMILARITY if min_score is None else min_score
+        count = len(self._positions)
+        if not count:
+            return []
+
+        scores = self._matrix[:count] @ self.vectorizer.transform(query)
+        if count > top_k:
+            candidates = np.argpartition(scores, -top_k)[-top_k:]
+        else:
+            candidates = np.arange(count)
+        # Keep conversation order so the retrieved turns read naturally
+        return [
+            (self._positions[index], float(scores[index]))
+            for index in np.sort(candidates)
+            if scores[index] >= min_score
+        ]
@@ -0,0 +1,58 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Set
+from config import Config
+
+# One pool per process; summaries are I/O bound so a few threads serve every session
+_executor = ThreadPoolExecutor(max_workers=Config.SUMMARY_WORKERS, thread_name_prefix="context-summary")
+
+class SummaryScheduler:
+    """Generate context summaries in the background, at most one per session at a time"""
+
+    def __init__(self, llm_client):
+        self.llm_client = llm_client
+        self._in_flight: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def is_running(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._in_flight
+
+    def schedule(self, chat_manager, session) -> Optional[Future]:
+        """Queue a summary of the session; returns None if one is already running for it"""
+        if len(session.messages) <= session.summary_watermark:
+            return None  # Nothing new since the last summary
+
+        with self._lock:
+            if session.id in self._in_flight:
+                return None
+            self._in_flight.add(session.id)
+
+        # Snapshot the messages so the worker never sees a list being appended to
+        watermark = len(session.messages)
+        if Config.ROLLING_SUMMARY and session.context_summary:
+            messages = session.messages[session.summary_watermark:watermark]
+            previous_summary = session.context_summary
+        else:
+            # A fresh summary only covers the latest context window
+            messages = session.messages[-Config.CONTEXT_WINDOW_MESSAGES:]
+            previous_summary = None
+        messages = [msg.to_provider_dict() for msg in messages]
+        try:
+            return _executor.submit(self._run, chat_manager, session, messages, previous_summary, watermark)
+        except RuntimeError:
+            # The pool is shut down while the interpreter exits
+            with self._lock:
+                self._in_flight.discard(session.id)
+            return None
+
+    def _run(self, chat_manager, session, messages, previous_summary, watermark) -> None:
+        try:
+            summary = self.llm_client.generate_context_summary(messages, previous_summary)
+            if summary:
+                chat_manager.update_context_summary(summary, session, watermark)
+        except Exception as e:
+            print(f"Failed to generate context summary: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(session.id)
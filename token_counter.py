@@ -0,0 +1,41 @@
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def _is_cjk(char: str) -> bool:
+    """CJK ideographs, kana and full-width forms tokenize at roughly one token per character"""
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF  # Hiragana, Katakana
+        or 0x3400 <= code <= 0x4DBF  # CJK Extension A
+        or 0x4E00 <= code <= 0x9FFF  # CJK Unified Ideographs
+        or 0xAC00 <= code <= 0xD7AF  # Hangul
+        or 0xF900 <= code <= 0xFAFF  # CJK Compatibility Ideographs
+        or 0xFF00 <= code <= 0xFFEF  # Half/full-width forms
+        or unicodedata.east_asian_width(char) == "W"
+    )
+
+@lru_cache(maxsize=128)
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text without a provider-specific tokenizer"""
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if ord(char) > 0x2E7F and _is_cjk(char))
+    # Latin text averages about four characters per token
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+def message_tokens(message) -> int:
+    """Token count of a ChatMessage, computed once and cached on the message itself"""
+    tokens = message.tokens
+    if tokens is None:
+        tokens = count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+        message.tokens = tokens
+    return tokens
+
+def count_messages_tokens(messages: List[Dict]) -> int:
+    """Estimated prompt size of a request in provider dict format"""
+    return sum(count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for message in messages)
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 from datetime import datetime
 import pytz
@@ -15,6 +16,40 @@ def render_message(role: str, content: str, timezone: str = Config.DEFAULT_TIMEZ
         with st.chat_message(role):
             st.write(content)
 
+def _show_older(page_key: str):
+    st.session_state[page_key] += Config.CHAT_PAGE_SIZE
+
+@st.fragment
+def render_chat_pane(i18n, chat_manager):
+    """メッセージ一覧をフラグメントとして表示し、古いメッセージはページ単位で読み込む"""
+    session = chat_manager.current_session
+    page_key = f"chat_page_size_{session.id}"
+    if page_key not in st.session_state:
+        st.session_state[page_key] = Config.CHAT_PAGE_SIZE
+    total = len(session.messages)
+    start = max(0, total - st.session_state[page_key])
+
+    if session.context_summary:
+        render_message("system", f"Previous conversation context: {session.context_summary}")
+    if start:
+        # Only this fragment reruns when older messages are requested
+        st.button(
+            i18n.get_text("load_older").format(count=start),
+            key=f"load_older_{session.id}",
+            on_click=_show_older,
+            args=(page_key,)
+        )
+
+    # Only the visible page is read; older messages stay out of the render loop
+    for message in session.messages[start:]:
+        render_message(message.role, message.content)
+
+def render_message_stream(role: str, chunks) -> str:
+    """トークンを受信した順に表示し、最終的なテキストを返す"""
+    avatar = {"assistant": "🤖", "user": "👤"}.get(role)
+    with st.chat_message(role, avatar=avatar):
+        return st.write_stream(chunks)
+
 def show_notification(message: str, type: str = "info", duration: int = 3):
     """Show an elegant notification toast."""
     if type == "error":
@@ -52,11 +87,20 @@ def render_sidebar(i18n, chat_manager):
         # Model selection - デフォルトをGemini-2.0に設定
         model = st.selectbox(
             i18n.get_text("model_selection"),
-            ["GPT-4", "Gemini-2.0", "Claude-3.5"],
+            list(Config.AVAILABLE_MODELS),
             index=1,
             key="model_selection"
         )
 
+        # Compare mode - 同じ質問を複数モデルへ同時に送信
+        if st.checkbox(i18n.get_text("compare_mode"), key="compare_mode"):
+            st.multiselect(
+                i18n.get_text("compare_models"),
+                list(Config.AVAILABLE_MODELS),
+                default=list(Config.AVAILABLE_MODELS),
+                key="compare_models"
+            )
+
         # Timezone selection
         timezone = st.selectbox(
             i18n.get_text("timezone"),
@@ -82,9 +126,51 @@ def render_sidebar(i18n, chat_manager):
                     filename = chat_manager.save_markdown_file(timezone=timezone)
                     show_notification(f"{i18n.get_text('export_success')} ({filename})", "success")
                 else:
-                    filename = chat_manager.export_chat_pdf(timezone=timezone)
-                    show_notification(f"{i18n.get_text('export_success')} ({filename})", "success")
+                    # Rendering runs in a worker process; progress is shown by render_pdf_jobs
+                    st.session_state.pdf_export_queue.submit(chat_manager.pdf_document(timezone=timezone))
             except Exception as e:
                 show_notification(f"{i18n.get_text('export_error')}: {str(e)}", "error")
 
-        return language, model
\ No newline at end of file
+        if st.button(i18n.get_text("export_all_chats"), key="export_all_button"):
+            try:
+                timezone = st.session_state.get("timezone", Config.DEFAULT_TIMEZONE)
+                filename = chat_manager.export_history_archive(timezone=timezone)
+                show_notification(f"{i18n.get_text('export_success')} ({filename})", "success")
+            except Exception as e:
+                show_notification(f"{i18n.get_text('export_error')}: {str(e)}", "error")
+
+        if st.session_state.pdf_export_queue.pending():
+            _render_pdf_jobs_polling(i18n)
+        else:
+            render_pdf_jobs(i18n)
+
+        return language, model
+
+def render_pdf_jobs(i18n):
+    """PDFエクスポートジョブの状態と、完了したファイルのダウンロードボタンを表示"""
+    queue = st.session_state.pdf_export_queue
+    for job in list(queue.jobs.values()):
+        status = job.status
+        if status == "done":
+            with open(job.filename, "rb") as f:
+                st.download_button(
+                    f"{i18n.get_text('download_pdf')}: {job.label}",
+                    data=f.read(),
+                    file_name=os.path.basename(job.filename),
+                    mime="application/pdf",
+                    key=f"pdf_download_{job.id}",
+                    on_click=queue.discard,
+                    args=(job.id,)
+                )
+        elif status == "failed":
+            st.error(f"{i18n.get_text('export_pdf_error')}: {job.error}", icon="🚨")
+            queue.discard(job.id)
+        else:
+            st.caption(f"{job.label}: {i18n.get_text('pdf_job_' + status)}")
+
+@st.fragment(run_every=1.0)
+def _render_pdf_jobs_polling(i18n):
+    """ジョブが終わるまで毎秒このフラグメントだけを再実行する"""
+    render_pdf_jobs(i18n)
+    if not st.session_state.pdf_export_queue.pending():
+        st.rerun()